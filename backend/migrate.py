@@ -0,0 +1,178 @@
+"""Online migration of ISO-string timestamps to BSON dates.
+
+Converts each time field in batches while the app keeps serving: every
+update is conditional on the string it read, so a document rewritten
+concurrently is left alone and picked up again on the next run.
+
+    python backend/migrate.py --dry-run
+    python backend/migrate.py --benchmark --output migration.json
+
+Existing UUID ids are kept; they are referenced from likes, saves, comments,
+timelines and URLs, so only new documents get ObjectId ids.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+import server  # noqa: E402
+from server import FEED_SORT, STORY_TTL  # noqa: E402
+
+TIME_FIELDS = {
+    "users": ("created_at",),
+    "posts": ("created_at",),
+    "stories": ("created_at",),
+    "comments": ("created_at",),
+    "likes": ("created_at",),
+    "saves": ("created_at",),
+    "follows": ("created_at",),
+    "timelines": ("created_at",),
+    "story_views": ("seen_until",),
+    "explore": ("computed_at",),
+}
+
+
+def parse_timestamp(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+async def migrate_field(collection, field: str, batch_size: int, pause: float, dry_run: bool) -> dict:
+    query = {field: {"$type": "string"}}
+    if dry_run:
+        return {"pending": await collection.count_documents(query)}
+    converted = skipped = 0
+    last_id = None
+    while True:
+        # Walk _id order so unparseable values are passed over, not re-read forever
+        page = query if last_id is None else {**query, "_id": {"$gt": last_id}}
+        batch = await collection.find(page, {"_id": 1, field: 1}).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+        last_id = batch[-1]["_id"]
+        ops = []
+        for doc in batch:
+            try:
+                value = parse_timestamp(doc[field])
+            except ValueError:
+                skipped += 1
+                continue
+            ops.append(UpdateOne({"_id": doc["_id"], field: doc[field]}, {"$set": {field: value}}))
+        if ops:
+            result = await collection.bulk_write(ops, ordered=False)
+            converted += result.modified_count
+        if pause:
+            await asyncio.sleep(pause)
+    return {"converted": converted, "skipped": skipped}
+
+
+async def backfill_story_expiry(db, batch_size: int, dry_run: bool) -> dict:
+    """Stories written before expiry existed get created_at + STORY_TTL."""
+    query = {"expires_at": {"$exists": False}, "created_at": {"$type": "date"}}
+    if dry_run:
+        return {"pending": await db.stories.count_documents(query)}
+    updated = 0
+    while batch := await db.stories.find(query, {"_id": 1, "created_at": 1}).limit(batch_size).to_list(batch_size):
+        result = await db.stories.bulk_write(
+            [UpdateOne({"_id": d["_id"]}, {"$set": {"expires_at": d["created_at"] + STORY_TTL}}) for d in batch],
+            ordered=False,
+        )
+        updated += result.modified_count
+    return {"updated": updated}
+
+
+async def timed(query, runs: int) -> float:
+    """Median milliseconds to fully read `query()`."""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        await query().to_list(None)
+        samples.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(samples), 3)
+
+
+async def benchmark(db, runs: int) -> dict:
+    """Index sizes and sorted-read latency for the collections the feed touches."""
+    report = {"collections": {}, "queries": {}}
+    for name in ("posts", "comments", "timelines", "likes"):
+        try:
+            stats = await db.command({"collStats": name})
+        except (OperationFailure, NotImplementedError):
+            continue
+        report["collections"][name] = {
+            "count": stats.get("count", 0),
+            "avg_obj_size": stats.get("avgObjSize", 0),
+            "total_index_size": stats.get("totalIndexSize", 0),
+            "index_sizes": stats.get("indexSizes", {}),
+        }
+    deep = await db.posts.find({}, {"_id": 0, "created_at": 1}).sort(FEED_SORT).skip(1000).limit(1).to_list(1)
+    report["queries"] = {
+        "posts_first_page_ms": await timed(lambda: db.posts.find({}, {"_id": 0}).sort(FEED_SORT).limit(20), runs),
+        "posts_deep_page_ms": await timed(
+            lambda: db.posts.find({"created_at": {"$lte": deep[0]["created_at"]}} if deep else {}, {"_id": 0})
+            .sort(FEED_SORT).limit(20),
+            runs,
+        ),
+        "comments_sorted_ms": await timed(
+            lambda: db.comments.find({}, {"_id": 0}).sort("created_at", -1).limit(100), runs
+        ),
+    }
+    return report
+
+
+async def run(args) -> dict:
+    db = server.connect()
+    results = {"dry_run": args.dry_run, "fields": {}}
+    if args.benchmark:
+        results["before"] = await benchmark(db, args.runs)
+    for name, fields in TIME_FIELDS.items():
+        if args.collections and name not in args.collections:
+            continue
+        for field in fields:
+            start = time.perf_counter()
+            outcome = await migrate_field(db[name], field, args.batch_size, args.pause, args.dry_run)
+            outcome["seconds"] = round(time.perf_counter() - start, 3)
+            results["fields"][f"{name}.{field}"] = outcome
+            print(f"{name}.{field}: {outcome}")
+    if not args.collections or "stories" in args.collections:
+        results["fields"]["stories.expires_at"] = await backfill_story_expiry(db, args.batch_size, args.dry_run)
+        print(f"stories.expires_at: {results['fields']['stories.expires_at']}")
+    if args.benchmark:
+        results["after"] = await benchmark(db, args.runs)
+        for key in results["after"]["queries"]:
+            print(f"{key}: {results['before']['queries'][key]} -> {results['after']['queries'][key]}")
+        for name, after in results["after"]["collections"].items():
+            before = results["before"]["collections"].get(name, {})
+            print(f"{name} index bytes: {before.get('total_index_size')} -> {after['total_index_size']}")
+    server.client.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="only count documents still holding strings")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between batches")
+    parser.add_argument("--collections", nargs="*", help="limit to these collections")
+    parser.add_argument("--benchmark", action="store_true", help="measure index sizes and sorted reads before and after")
+    parser.add_argument("--runs", type=int, default=20, help="repetitions per benchmarked query")
+    parser.add_argument("--output", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
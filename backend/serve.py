@@ -0,0 +1,149 @@
+"""Pre-fork launcher: bind the port once and fork uvicorn workers onto it.
+
+    python backend/serve.py --workers 4 --port 8001
+    kill -HUP <pid>    # rolling restart, one worker at a time
+    kill -TERM <pid>   # graceful stop
+
+Each worker builds its own Motor client in the app's lifespan, i.e. after
+the fork, so no driver sockets or monitor threads are shared. Workers start
+`--stagger` seconds apart, so a restart ramps connections up gradually
+instead of every worker dialing MongoDB at once.
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from pathlib import Path
+
+import uvicorn
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+logger = logging.getLogger("serve")
+
+
+class Arbiter:
+    def __init__(self, args):
+        self.args = args
+        self.app = "server:app"
+        self.workers = {}  # pid -> started_at
+        self.stopping = False
+        self.reload = False
+        self.sock = socket.socket(socket.AF_INET6 if ":" in args.host else socket.AF_INET)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((args.host, args.port))
+        self.sock.listen(args.backlog)
+        self.sock.set_inheritable(True)
+        # Read by the app at import, so set before --preload imports it
+        os.environ["WEB_WORKERS"] = str(args.workers)
+        if args.workers > 1 and not os.environ.get("CACHE_URL"):
+            logger.warning(
+                "CACHE_URL is not set: each of the %d workers keeps its own cache versions, so ETags are off",
+                args.workers,
+            )
+        if args.preload:
+            # Safe: importing the app creates no client; that happens per worker
+            from server import app
+
+            self.app = app
+
+    def spawn(self):
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = time.monotonic()
+            return pid
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGCHLD):
+            signal.signal(sig, signal.SIG_DFL)
+        config = uvicorn.Config(
+            self.app,
+            lifespan="on",
+            timeout_graceful_shutdown=self.args.graceful_timeout,
+            log_level=self.args.log_level,
+        )
+        uvicorn.Server(config).run(sockets=[self.sock])
+        os._exit(0)
+
+    def stop(self, pids, timeout):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + timeout
+        while pids and time.monotonic() < deadline:
+            pids = [pid for pid in pids if not self.reap(pid)]
+            time.sleep(0.1)
+        for pid in pids:
+            os.kill(pid, signal.SIGKILL)
+            self.reap(pid, block=True)
+
+    def reap(self, pid, block=False) -> bool:
+        try:
+            done, _ = os.waitpid(pid, 0 if block else os.WNOHANG)
+        except ChildProcessError:
+            done = pid
+        if done:
+            self.workers.pop(pid, None)
+        return bool(done)
+
+    def rolling_restart(self):
+        """Replace workers one by one: start the new one, then drain an old one."""
+        for pid in list(self.workers):
+            self.spawn()
+            time.sleep(self.args.stagger)
+            self.stop([pid], self.args.graceful_timeout + 5)
+            if self.stopping:
+                return
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.on_stop)
+        signal.signal(signal.SIGINT, self.on_stop)
+        signal.signal(signal.SIGHUP, self.on_reload)
+        logger.info("Listening on %s:%d with %d workers", self.args.host, self.args.port, self.args.workers)
+        for i in range(self.args.workers):
+            if i:
+                time.sleep(self.args.stagger)
+            self.spawn()
+        while not self.stopping:
+            if self.reload:
+                self.reload = False
+                self.rolling_restart()
+            for pid in list(self.workers):
+                if self.reap(pid) and not self.stopping:
+                    # A worker that died right after starting would otherwise respawn in a hot loop
+                    logger.warning("Worker %d exited; replacing it", pid)
+                    time.sleep(self.args.stagger)
+                    self.spawn()
+            time.sleep(0.5)
+        self.stop(list(self.workers), self.args.graceful_timeout + 5)
+        logger.info("All workers stopped")
+
+    def on_stop(self, signum, frame):
+        self.stopping = True
+
+    def on_reload(self, signum, frame):
+        self.reload = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--stagger", type=float, default=0.5, help="seconds between worker starts")
+    parser.add_argument("--graceful-timeout", type=int, default=20, help="seconds a worker may drain on stop")
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--preload", action="store_true", help="import the app once before forking")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    Arbiter(args).run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,29 +1,574 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Header, Depends, Request
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from bson import ObjectId, json_util
+from bson.json_util import JSONOptions
+from pymongo import IndexModel, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, OperationFailure
+from contextlib import asynccontextmanager, suppress
 import os
+import random
+import re
+import math
+import heapq
+import bisect
+from itertools import islice
+import asyncio
 import logging
+import threading
+import cProfile
+import io
+import pstats
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
+from pydantic import BaseModel, Field, ConfigDict, TypeAdapter
+from typing import Dict, Iterable, List, Optional, Union
 import uuid
-from datetime import datetime, timezone
+import base64
+import hashlib
+import json
+from urllib.parse import urlsplit
+import orjson
+import numpy as np
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # optional: only needed when CACHE_URL points at Redis
+    aioredis = None
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Instrumentation
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "100"))
+
+class Metrics:
+    """Thread-safe counters, gauges and histograms rendered in Prometheus text format.
+
+    PyMongo command events arrive on driver threads, hence the lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}  # name -> (type, help, {labels: value})
+
+    def _values(self, name, kind, help_text):
+        if name not in self._series:
+            self._series[name] = (kind, help_text, {})
+        return self._series[name][2]
+
+    def inc(self, name: str, help_text: str, labels: dict, value: float = 1):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            values = self._values(name, "counter", help_text)
+            values[key] = values.get(key, 0) + value
+
+    def set(self, name: str, help_text: str, labels: dict, value: float):
+        with self._lock:
+            self._values(name, "gauge", help_text)[tuple(sorted(labels.items()))] = value
+
+    def observe(self, name: str, help_text: str, labels: dict, value: float, buckets=LATENCY_BUCKETS):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            values = self._values(name, "histogram", help_text)
+            hist = values.get(key)
+            if hist is None:
+                hist = values[key] = {"buckets": buckets, "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    hist["counts"][i] += 1
+            hist["sum"] += value
+            hist["count"] += 1
+
+    @staticmethod
+    def _labels(key, extra=()):
+        pairs = [*key, *extra]
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{str(v)}"' for k, v in pairs) + "}"
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, values) in sorted(self._series.items()):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key, value in sorted(values.items()):
+                    if kind != "histogram":
+                        lines.append(f"{name}{self._labels(key)} {value}")
+                        continue
+                    for bound, count in zip(value["buckets"], value["counts"]):
+                        lines.append(f"{name}_bucket{self._labels(key, [('le', bound)])} {count}")
+                    lines.append(f"{name}_bucket{self._labels(key, [('le', '+Inf')])} {value['count']}")
+                    lines.append(f"{name}_sum{self._labels(key)} {value['sum']}")
+                    lines.append(f"{name}_count{self._labels(key)} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Per-collection command counts and durations; logs commands slower than SLOW_QUERY_MS."""
+
+    def __init__(self):
+        self._collections = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = event.command.get("collection", "")
+        self._collections[(event.connection_id, event.request_id)] = collection
+
+    def _finish(self, event, status):
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        labels = {"collection": collection, "command": event.command_name}
+        seconds = event.duration_micros / 1e6
+        metrics.inc("mongo_commands_total", "MongoDB commands issued", {**labels, "status": status})
+        metrics.observe("mongo_command_duration_seconds", "MongoDB command latency", labels, seconds)
+        if seconds * 1000 >= SLOW_QUERY_MS:
+            metrics.inc("mongo_slow_commands_total", f"MongoDB commands slower than {SLOW_QUERY_MS:g}ms", labels)
+            logger.warning("Slow MongoDB %s on %s: %.1fms", event.command_name, collection, seconds * 1000)
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+
+    def failed(self, event):
+        self._finish(event, "error")
+
+class RouteProfiler:
+    """Opt-in sampling profiler: PROFILE_ROUTES=/api/posts,/api/feed PROFILE_SAMPLE_RATE=0.01.
+
+    cProfile is process-wide, so at most one sampled request is profiled at a
+    time; concurrent requests on the same loop show up in its samples too.
+    """
+
+    def __init__(self, prefixes, rate: float):
+        self.prefixes = tuple(prefixes)
+        self.rate = rate
+        self.stats = {}
+        self._active = False
+
+    def start(self, path: str):
+        if self._active or not self.prefixes or not path.startswith(self.prefixes) or random.random() >= self.rate:
+            return None
+        self._active = True
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def stop(self, profile, route: str):
+        profile.disable()
+        self._active = False
+        if route in self.stats:
+            self.stats[route].add(profile)
+        else:
+            self.stats[route] = pstats.Stats(profile)
+
+    def report(self, route: str, limit: int) -> str:
+        if route not in self.stats:
+            return f"no samples for {route}\n"
+        stats = self.stats[route]
+        stats.stream = out = io.StringIO()
+        stats.sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+profiler = RouteProfiler(
+    [p for p in os.environ.get("PROFILE_ROUTES", "").split(",") if p],
+    float(os.environ.get("PROFILE_SAMPLE_RATE", "0.01")),
+)
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency, status, payload sizes and in-flight requests."""
+
+    def __init__(self, app):
+        self.app = app
+        self._in_flight = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = {"code": 500, "bytes": 0}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            elif message["type"] == "http.response.body":
+                status["bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        self._in_flight += 1
+        metrics.set("http_requests_in_flight", "Requests currently being served", {}, self._in_flight)
+        profile = profiler.start(scope["path"])
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self._in_flight -= 1
+            metrics.set("http_requests_in_flight", "Requests currently being served", {}, self._in_flight)
+            route = route_template(scope)
+            if profile:
+                profiler.stop(profile, route)
+            labels = {"method": scope["method"], "route": route}
+            metrics.inc("http_requests_total", "HTTP requests served", {**labels, "status": status["code"]})
+            metrics.observe("http_request_duration_seconds", "HTTP request latency", labels, time.perf_counter() - start)
+            metrics.observe("http_response_size_bytes", "HTTP response body size", labels, status["bytes"], SIZE_BUCKETS)
+            request_size = dict(scope["headers"]).get(b"content-length")
+            if request_size:
+                metrics.observe("http_request_size_bytes", "HTTP request body size", labels, int(request_size), SIZE_BUCKETS)
+
+_route_templates = {}
+
+def route_template(scope) -> str:
+    """Map the matched endpoint back to its path template so labels stay low-cardinality."""
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    if not _route_templates:
+        _route_templates.update({r.endpoint: r.path for r in app.routes if hasattr(r, "endpoint")})
+    return _route_templates.get(endpoint, "unmatched")
+
+# MongoDB
+# The client is created by connect() in the lifespan handler, i.e. after any
+# fork, so pre-forked workers never share driver sockets or monitor threads.
+# maxConnecting bounds how fast each worker opens sockets on a cold start.
+MONGO_CLIENT_OPTIONS = {
+    "maxPoolSize": int(os.environ.get("MONGO_MAX_POOL_SIZE", "100")),
+    "minPoolSize": int(os.environ.get("MONGO_MIN_POOL_SIZE", "5")),
+    "maxConnecting": int(os.environ.get("MONGO_MAX_CONNECTING", "2")),
+    "maxIdleTimeMS": int(os.environ.get("MONGO_MAX_IDLE_MS", "300000")),
+    "connectTimeoutMS": int(os.environ.get("MONGO_CONNECT_TIMEOUT_MS", "5000")),
+    "serverSelectionTimeoutMS": int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+    "waitQueueTimeoutMS": int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000")),
+}
+if os.environ.get("MONGO_SOCKET_TIMEOUT_MS"):
+    MONGO_CLIENT_OPTIONS["socketTimeoutMS"] = int(os.environ["MONGO_SOCKET_TIMEOUT_MS"])
+
+client = None
+db = None
+
+def connect():
+    """Create this process's Motor client unless one is already set."""
+    global client, db
+    if client is None:
+        client = AsyncIOMotorClient(
+            os.environ['MONGO_URL'],
+            tz_aware=True,
+            event_listeners=[MongoCommandMetrics()],
+            **MONGO_CLIENT_OPTIONS,
+        )
+        db = client[os.environ['DB_NAME']]
+    return db
+
+async def warm_up():
+    """Fill the pool to minPoolSize so first requests skip connection handshakes."""
+    await client.admin.command("ping")
+    await asyncio.gather(*(client.admin.command("ping") for _ in range(MONGO_CLIENT_OPTIONS["minPoolSize"])))
 
-app = FastAPI()
 api_router = APIRouter(prefix="/api")
 
+# There is no auth yet; clients may identify themselves with X-User-Id
+CURRENT_USER_ID = "user_1"
+
+def get_viewer_id(x_user_id: Optional[str] = Header(None)) -> str:
+    return x_user_id or CURRENT_USER_ID
+
+# Response cache
+class ResponseCache:
+    """Bounded in-process cache with per-entry TTLs and LRU eviction.
+
+    Keys are "<route>" or "<route>:<arg>"; hit/miss counters are kept per route.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = {}
+        self.misses = {}
+        self.evictions = 0
+
+    @staticmethod
+    def _route(key: str) -> str:
+        return key.split(":", 1)[0]
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        route = self._route(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses[route] = self.misses.get(route, 0) + 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits[route] = self.hits.get(route, 0) + 1
+        return entry[1]
+
+    def set(self, key: str, value, ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, *keys: str):
+        for key in keys:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        routes = sorted(set(self.hits) | set(self.misses))
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "evictions": self.evictions,
+            "routes": {r: {"hits": self.hits.get(r, 0), "misses": self.misses.get(r, 0)} for r in routes},
+        }
+
+class MemoryCacheBackend:
+    """Per-process cache; each worker keeps its own entries."""
+
+    name = "memory"
+    # Versions bumped here are invisible to other workers
+    shared = False
+
+    def __init__(self, store: ResponseCache):
+        self.store = store
+        # Versions restart at zero with the process; the epoch keeps old ETags from matching
+        self.epoch = uuid.uuid4().hex[:8]
+        self._versions = {}
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def get(self, key: str):
+        return self.store.get(key)
+
+    async def set(self, key: str, value, ttl: float):
+        self.store.set(key, value, ttl)
+
+    async def invalidate(self, *keys: str):
+        self.store.invalidate(*keys)
+
+    async def clear(self):
+        self.store.clear()
+
+    async def bump(self, *collections: str):
+        """Advance the version of collections whose served content just changed."""
+        for name in collections:
+            self._versions[name] = self._versions.get(name, 0) + 1
+
+    async def versions(self, collections) -> str:
+        return self.epoch + ":" + ",".join(str(self._versions.get(name, 0)) for name in collections)
+
+    def stats(self) -> dict:
+        return {"backend": self.name, **self.store.stats()}
+
+CACHE_JSON_OPTIONS = JSONOptions(tz_aware=True, tzinfo=timezone.utc)
+
+class RedisCacheBackend(MemoryCacheBackend):
+    """Cache shared by all workers through a Redis-protocol server.
+
+    Entries are stored in Redis as Extended JSON (so datetimes round-trip)
+    and mirrored in a short-lived local store. Invalidations are published on a channel so every other worker
+    drops its local copy too.
+    """
+
+    name = "redis"
+    shared = True
+    prefix = "cache:"
+    channel = "cache:invalidate"
+    # Kept in the versions hash: if Redis loses it, counters restart at zero
+    # under a new epoch, so tags issued before can never match again
+    epoch_field = "_epoch"
+
+    def __init__(self, redis, store: ResponseCache, local_ttl: float = 5):
+        super().__init__(store)
+        self.redis = redis
+        self.local_ttl = local_ttl
+        self.node_id = uuid.uuid4().hex
+        self.shared_hits = {}
+        self._listener = None
+
+    async def start(self):
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(self.channel)
+        self._listener = asyncio.create_task(self._listen(pubsub))
+
+    async def close(self):
+        if self._listener:
+            self._listener.cancel()
+        await self.redis.aclose()
+
+    async def _listen(self, pubsub):
+        try:
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                event = json.loads(message["data"])
+                if event["node"] == self.node_id:
+                    continue
+                if event.get("clear"):
+                    self.store.clear()
+                else:
+                    self.store.invalidate(*event["keys"])
+        except asyncio.CancelledError:
+            await pubsub.aclose()
+            raise
+        except Exception:
+            logger.exception("Cache invalidation listener stopped")
+
+    async def _publish(self, **event):
+        await self.redis.publish(self.channel, json.dumps({"node": self.node_id, **event}))
+
+    async def get(self, key: str):
+        value = self.store.get(key)
+        if value is not None:
+            return value
+        raw = await self.redis.get(self.prefix + key)
+        if raw is None:
+            return None
+        value = json_util.loads(raw, json_options=CACHE_JSON_OPTIONS)
+        route = ResponseCache._route(key)
+        self.shared_hits[route] = self.shared_hits.get(route, 0) + 1
+        self.store.set(key, value, self.local_ttl)
+        return value
+
+    async def set(self, key: str, value, ttl: float):
+        self.store.set(key, value, min(ttl, self.local_ttl))
+        await self.redis.set(self.prefix + key, json_util.dumps(value, json_options=CACHE_JSON_OPTIONS), px=int(ttl * 1000))
+
+    async def invalidate(self, *keys: str):
+        self.store.invalidate(*keys)
+        await self.redis.delete(*(self.prefix + k for k in keys))
+        await self._publish(keys=list(keys))
+
+    async def clear(self):
+        self.store.clear()
+        stale = [k async for k in self.redis.scan_iter(match=self.prefix + "*")]
+        stale = [k for k in stale if k not in (self.prefix + "versions", (self.prefix + "versions").encode())]
+        if stale:
+            await self.redis.delete(*stale)
+        await self._publish(clear=True)
+
+    async def bump(self, *collections: str):
+        pipe = self.redis.pipeline()
+        for name in collections:
+            pipe.hincrby(self.prefix + "versions", name, 1)
+        await pipe.execute()
+
+    async def versions(self, collections) -> str:
+        key = self.prefix + "versions"
+        epoch, *values = await self.redis.hmget(key, [self.epoch_field, *collections])
+        if epoch is None:
+            await self.redis.hsetnx(key, self.epoch_field, uuid.uuid4().hex[:8])
+            epoch, *values = await self.redis.hmget(key, [self.epoch_field, *collections])
+        if isinstance(epoch, bytes):
+            epoch = epoch.decode()
+        return epoch + ":" + ",".join(str(int(v or 0)) for v in values)
+
+    def stats(self) -> dict:
+        return {**super().stats(), "shared_hits": dict(self.shared_hits)}
+
+def make_cache():
+    store = ResponseCache(int(os.environ.get("CACHE_MAX_ENTRIES", "1024")))
+    url = os.environ.get("CACHE_URL")
+    if not url:
+        return MemoryCacheBackend(store)
+    if aioredis is None:
+        raise RuntimeError("CACHE_URL is set but the redis package is not installed")
+    return RedisCacheBackend(aioredis.from_url(url), store)
+
+# Seconds each cached route stays fresh; writes invalidate earlier
+CACHE_TTLS = {"stories": 30, "explore": 300, "users": 60, "reels": 30, "post": 15, "pull": 60}
+
+cache = make_cache()
+
+# Worker processes serving this app (set by backend/serve.py)
+WEB_WORKERS = int(os.environ.get("WEB_WORKERS", "1"))
+
+# Conditional GET
+# Served payloads depend on these collections; writes bump their versions and
+# the ETag is derived from the versions alone, so a 304 never reads documents.
+VERSIONED_COLLECTIONS = (
+    "posts", "likes", "saves", "comments", "users", "follows", "stories", "story_views", "explore",
+)
+ETAG_ROUTES = {
+    "posts": (("posts", "likes", "saves", "users", "comments"), "private, no-cache"),
+    "feed": (("posts", "likes", "saves", "users", "follows", "comments"), "private, no-cache"),
+    "profile": (("users", "posts", "saves"), "private, no-cache"),
+    "stories": (("stories", "users", "story_views"), "private, max-age=15, must-revalidate"),
+    "explore": (("explore",), "public, max-age=60, must-revalidate"),
+}
+# A write bumps versions only in the worker that served it, so with
+# per-process versions and several workers another worker would keep
+# answering 304 for content that changed: without a shared cache, no ETags.
+ETAGS_ENABLED = cache.shared or WEB_WORKERS == 1
+
+async def check_etag(request: Request, route: str, viewer_id: str = "", extra: str = ""):
+    """Return (etag, 304 response or None) for a conditional GET on `route`.
+
+    `extra` folds in state that does not live in a collection version.
+    Returns (None, None) when ETags are disabled.
+    """
+    if not ETAGS_ENABLED:
+        return None, None
+    collections, cache_control = ETAG_ROUTES[route]
+    versions = await cache.versions(collections)
+    digest = hashlib.sha1(f"{route}|{request.url.query}|{viewer_id}|{versions}|{extra}".encode()).hexdigest()
+    etag = f'"{digest[:24]}"'
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")) or if_none_match.strip() == "*":
+        return etag, Response(status_code=304, headers=validator_headers(route, etag))
+    return etag, None
+
+def validator_headers(route: str, etag: str) -> dict:
+    headers = {"ETag": etag, "Cache-Control": ETAG_ROUTES[route][1]}
+    if headers["Cache-Control"].startswith("private"):
+        headers["Vary"] = "X-User-Id"
+    return headers
+
+def with_etag(response: Response, route: str, etag: Optional[str]) -> Response:
+    if etag is not None:
+        response.headers.update(validator_headers(route, etag))
+    return response
+
+async def cached(key: str, loader):
+    value = await cache.get(key)
+    if value is None:
+        value = await loader()
+        if value is not None:
+            await cache.set(key, value, CACHE_TTLS[ResponseCache._route(key)])
+    return value
+
 # Models
+# Timestamps are BSON dates and ids are ObjectId strings, which are 12 bytes
+# shorter than UUIDs in every index and sort in creation order.
+def utcnow() -> datetime:
+    """Current UTC time truncated to BSON's millisecond precision."""
+    now = datetime.now(timezone.utc)
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+def new_id() -> str:
+    return str(ObjectId())
+
 class User(BaseModel):
     model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     username: str
     display_name: str
     avatar_url: str
@@ -32,47 +577,110 @@ class User(BaseModel):
     followers_count: int = 0
     following_count: int = 0
     is_verified: bool = False
-    created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    created_at: datetime = Field(default_factory=utcnow)
 
+# Posts, stories and comments store only user_id; username/user_avatar are
+# hydrated from users when served (see hydrate_authors)
 class Post(BaseModel):
     model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     user_id: str
-    username: str
-    user_avatar: str
     image_url: str
     caption: str = ""
     likes_count: int = 0
     comments_count: int = 0
-    is_liked: bool = False
-    is_saved: bool = False
+    saves_count: int = 0
     location: str = ""
-    created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    created_at: datetime = Field(default_factory=utcnow)
+
+# Stories are removed by a TTL index on expires_at; seen state is per viewer
+STORY_TTL = timedelta(hours=24)
 
 class Story(BaseModel):
     model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     user_id: str
-    username: str
-    user_avatar: str
     image_url: str
-    is_seen: bool = False
-    created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    created_at: datetime = Field(default_factory=utcnow)
+    expires_at: datetime = Field(default_factory=lambda: utcnow() + STORY_TTL)
 
 class Comment(BaseModel):
     model_config = ConfigDict(extra="ignore")
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    id: str = Field(default_factory=new_id)
     post_id: str
     user_id: str
-    username: str
-    user_avatar: str
     text: str
-    created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    created_at: datetime = Field(default_factory=utcnow)
 
 class CommentCreate(BaseModel):
-    text: str
-    username: str = "you"
-    user_avatar: str = "https://images.unsplash.com/photo-1662695089339-a2c24231a3ac?w=150"
+    text: str = Field(min_length=1, max_length=2200)
+
+class PostCreate(BaseModel):
+    image_url: str
+    caption: str = ""
+    location: str = ""
+
+class SubRequest(BaseModel):
+    id: Optional[str] = None
+    path: str
+
+class BatchRequest(BaseModel):
+    requests: List[SubRequest] = Field(min_length=1, max_length=10)
+
+# Response schemas
+class CommentOut(Comment):
+    username: str = ""
+    user_avatar: str = ""
+
+class CommentPage(BaseModel):
+    comments: List[CommentOut]
+    next_cursor: Optional[str] = None
+
+class PostOut(Post):
+    username: str = ""
+    user_avatar: str = ""
+    is_liked: bool = False
+    is_saved: bool = False
+    latest_comments: List[CommentOut] = []
+
+class PostPage(BaseModel):
+    posts: List[PostOut]
+    next_cursor: Optional[str] = None
+
+class StoryOut(Story):
+    username: str = ""
+    user_avatar: str = ""
+    is_seen: bool = False
+    story_count: int = 1
+
+class Reel(BaseModel):
+    id: str
+    post_id: str
+    user_id: str
+    username: str = ""
+    user_avatar: str = ""
+    video_thumbnail: str
+    caption: str = ""
+    likes_count: int = 0
+    comments_count: int = 0
+    music: str
+
+# Set VALIDATE_RESPONSES=1 (e.g. in tests) to check payloads against the schemas
+VALIDATE_RESPONSES = os.environ.get("VALIDATE_RESPONSES") == "1"
+_adapters = {}
+
+def json_response(content, schema=None) -> Response:
+    """Serialize straight to JSON bytes, skipping FastAPI's jsonable_encoder walk.
+
+    With VALIDATE_RESPONSES on, `schema` is validated and dumped by
+    pydantic-core in one pass instead of validate + encode + dumps.
+    """
+    if schema is not None and VALIDATE_RESPONSES:
+        adapter = _adapters.get(schema)
+        if adapter is None:
+            adapter = _adapters[schema] = TypeAdapter(schema)
+        return Response(adapter.dump_json(adapter.validate_python(content)), media_type="application/json")
+    return ORJSONResponse(content)
 
 # Seed data
 SEED_USERS = [
@@ -148,8 +756,6 @@ SEED_POSTS = [
     {
         "id": "post_1",
         "user_id": "user_1",
-        "username": "aria.lens",
-        "user_avatar": "https://images.unsplash.com/photo-1757700356475-40b0c6c5554e?w=150&h=150&fit=crop",
         "image_url": "https://images.unsplash.com/photo-1713959989861-2425c95e9777?w=800&h=1000&fit=crop",
         "caption": "Lost in the beauty of nature. Every trail tells a story.",
         "likes_count": 1243,
@@ -159,8 +765,6 @@ SEED_POSTS = [
     {
         "id": "post_2",
         "user_id": "user_2",
-        "username": "marco.studio",
-        "user_avatar": "https://images.unsplash.com/photo-1582657233895-0f37a3f150c0?w=150&h=150&fit=crop",
         "image_url": "https://images.unsplash.com/photo-1680210849773-f97a41c6b7ed?w=800&h=1000&fit=crop",
         "caption": "Minimalism is not about having less. It's about making room for more of what matters.",
         "likes_count": 876,
@@ -170,8 +774,6 @@ SEED_POSTS = [
     {
         "id": "post_3",
         "user_id": "user_3",
-        "username": "luna.eats",
-        "user_avatar": "https://images.unsplash.com/photo-1763328719057-ff6b03c816d0?w=150&h=150&fit=crop",
         "image_url": "https://images.unsplash.com/photo-1766491764801-bc6e409b60e4?w=800&h=1000&fit=crop",
         "caption": "Sunday brunch done right. Recipe link in bio!",
         "likes_count": 2341,
@@ -181,8 +783,6 @@ SEED_POSTS = [
     {
         "id": "post_4",
         "user_id": "user_5",
-        "username": "sophia.vibes",
-        "user_avatar": "https://images.unsplash.com/photo-1713261162282-57dd8043329a?w=150&h=150&fit=crop",
         "image_url": "https://images.unsplash.com/photo-1719150006656-958724675d9d?w=800&h=1000&fit=crop",
         "caption": "Design is intelligence made visible.",
         "likes_count": 1567,
@@ -192,8 +792,6 @@ SEED_POSTS = [
     {
         "id": "post_5",
         "user_id": "user_4",
-        "username": "kai.explores",
-        "user_avatar": "https://images.unsplash.com/photo-1758691737387-a89bb8adf768?w=150&h=150&fit=crop",
         "image_url": "https://images.unsplash.com/photo-1748909082924-ec91097de9af?w=800&h=1000&fit=crop",
         "caption": "The world is a book and those who do not travel read only one page.",
         "likes_count": 3456,
@@ -203,8 +801,6 @@ SEED_POSTS = [
     {
         "id": "post_6",
         "user_id": "user_6",
-        "username": "dev.james",
-        "user_avatar": "https://images.unsplash.com/photo-1662695089339-a2c24231a3ac?w=150&h=150&fit=crop",
         "image_url": "https://images.unsplash.com/photo-1766491765420-2f4f2c4bf49a?w=800&h=1000&fit=crop",
         "caption": "Coffee and code. The perfect afternoon combo.",
         "likes_count": 654,
@@ -214,12 +810,12 @@ SEED_POSTS = [
 ]
 
 SEED_STORIES = [
-    {"id": "story_1", "user_id": "user_1", "username": "aria.lens", "user_avatar": "https://images.unsplash.com/photo-1757700356475-40b0c6c5554e?w=150&h=150&fit=crop", "image_url": "https://images.unsplash.com/photo-1713959989861-2425c95e9777?w=600", "is_seen": False},
-    {"id": "story_2", "user_id": "user_3", "username": "luna.eats", "user_avatar": "https://images.unsplash.com/photo-1763328719057-ff6b03c816d0?w=150&h=150&fit=crop", "image_url": "https://images.unsplash.com/photo-1766491764801-bc6e409b60e4?w=600", "is_seen": False},
-    {"id": "story_3", "user_id": "user_5", "username": "sophia.vibes", "user_avatar": "https://images.unsplash.com/photo-1713261162282-57dd8043329a?w=150&h=150&fit=crop", "image_url": "https://images.unsplash.com/photo-1719150006656-958724675d9d?w=600", "is_seen": True},
-    {"id": "story_4", "user_id": "user_2", "username": "marco.studio", "user_avatar": "https://images.unsplash.com/photo-1582657233895-0f37a3f150c0?w=150&h=150&fit=crop", "image_url": "https://images.unsplash.com/photo-1680210849773-f97a41c6b7ed?w=600", "is_seen": False},
-    {"id": "story_5", "user_id": "user_4", "username": "kai.explores", "user_avatar": "https://images.unsplash.com/photo-1758691737387-a89bb8adf768?w=150&h=150&fit=crop", "image_url": "https://images.unsplash.com/photo-1748909082924-ec91097de9af?w=600", "is_seen": False},
-    {"id": "story_6", "user_id": "user_6", "username": "dev.james", "user_avatar": "https://images.unsplash.com/photo-1662695089339-a2c24231a3ac?w=150&h=150&fit=crop", "image_url": "https://images.unsplash.com/photo-1691967057150-f57a7ca63e3e?w=600", "is_seen": True},
+    {"id": "story_1", "user_id": "user_1", "image_url": "https://images.unsplash.com/photo-1713959989861-2425c95e9777?w=600", "is_seen": False},
+    {"id": "story_2", "user_id": "user_3", "image_url": "https://images.unsplash.com/photo-1766491764801-bc6e409b60e4?w=600", "is_seen": False},
+    {"id": "story_3", "user_id": "user_5", "image_url": "https://images.unsplash.com/photo-1719150006656-958724675d9d?w=600", "is_seen": True},
+    {"id": "story_4", "user_id": "user_2", "image_url": "https://images.unsplash.com/photo-1680210849773-f97a41c6b7ed?w=600", "is_seen": False},
+    {"id": "story_5", "user_id": "user_4", "image_url": "https://images.unsplash.com/photo-1748909082924-ec91097de9af?w=600", "is_seen": False},
+    {"id": "story_6", "user_id": "user_6", "image_url": "https://images.unsplash.com/photo-1691967057150-f57a7ca63e3e?w=600", "is_seen": True},
 ]
 
 EXPLORE_IMAGES = [
@@ -238,171 +834,1809 @@ EXPLORE_IMAGES = [
 ]
 
 SEED_COMMENTS = [
-    {"id": "comment_1", "post_id": "post_1", "user_id": "user_3", "username": "luna.eats", "user_avatar": "https://images.unsplash.com/photo-1763328719057-ff6b03c816d0?w=150", "text": "Breathtaking view! Adding this to my bucket list."},
-    {"id": "comment_2", "post_id": "post_1", "user_id": "user_5", "username": "sophia.vibes", "user_avatar": "https://images.unsplash.com/photo-1713261162282-57dd8043329a?w=150", "text": "Nature never disappoints."},
-    {"id": "comment_3", "post_id": "post_2", "user_id": "user_1", "username": "aria.lens", "user_avatar": "https://images.unsplash.com/photo-1757700356475-40b0c6c5554e?w=150", "text": "This space is incredible!"},
-    {"id": "comment_4", "post_id": "post_3", "user_id": "user_4", "username": "kai.explores", "user_avatar": "https://images.unsplash.com/photo-1758691737387-a89bb8adf768?w=150", "text": "Looks delicious! Need the recipe ASAP."},
-    {"id": "comment_5", "post_id": "post_5", "user_id": "user_2", "username": "marco.studio", "user_avatar": "https://images.unsplash.com/photo-1582657233895-0f37a3f150c0?w=150", "text": "Paradise on earth. Great capture!"},
+    {"id": "comment_1", "post_id": "post_1", "user_id": "user_3", "text": "Breathtaking view! Adding this to my bucket list."},
+    {"id": "comment_2", "post_id": "post_1", "user_id": "user_5", "text": "Nature never disappoints."},
+    {"id": "comment_3", "post_id": "post_2", "user_id": "user_1", "text": "This space is incredible!"},
+    {"id": "comment_4", "post_id": "post_3", "user_id": "user_4", "text": "Looks delicious! Need the recipe ASAP."},
+    {"id": "comment_5", "post_id": "post_5", "user_id": "user_2", "text": "Paradise on earth. Great capture!"},
 ]
 
+# The current user follows everyone else so the seeded home feed is populated
+SEED_FOLLOWS = [
+    {"follower_id": "user_1", "followee_id": f"user_{i}"} for i in range(2, 7)
+]
+
+# Indexes
+FEED_SORT = [("created_at", -1), ("id", -1)]
+# Home timelines keep entries for this long (see "Home timelines")
+TIMELINE_TTL = timedelta(days=int(os.environ.get("TIMELINE_TTL_DAYS", "30")))
+SAVED_SORT = [("created_at", -1), ("post_id", -1)]
+
+INDEXES = {
+    "posts": [
+        IndexModel("id", unique=True),
+        IndexModel(FEED_SORT),
+        # Profile grids: a user's posts, newest first
+        IndexModel([("user_id", 1), *FEED_SORT]),
+    ],
+    "users": [IndexModel("id", unique=True)],
+    # Comment threads, newest first; also bounds each feed preview lookup
+    "comments": [IndexModel([("post_id", 1), *FEED_SORT])],
+    # Per-user like/save edges; user_id prefix also serves "saved by user" lookups
+    "likes": [IndexModel([("user_id", 1), ("post_id", 1)], unique=True)],
+    "saves": [
+        IndexModel([("user_id", 1), ("post_id", 1)], unique=True),
+        IndexModel([("user_id", 1), *SAVED_SORT]),
+    ],
+    # Follow graph in both directions, and per-owner home timelines
+    "follows": [
+        IndexModel([("follower_id", 1), ("followee_id", 1)], unique=True),
+        IndexModel("followee_id"),
+    ],
+    "timelines": [
+        IndexModel([("owner_id", 1), *SAVED_SORT]),
+        IndexModel([("owner_id", 1), ("author_id", 1)]),
+        # Bounds every timeline to a window of recent posts; a changed
+        # TIMELINE_TTL_DAYS is applied by create_indexes()
+        IndexModel("created_at", expireAfterSeconds=int(TIMELINE_TTL.total_seconds())),
+    ],
+    # Expired stories and seen markers are deleted by Mongo's TTL monitor
+    "stories": [IndexModel("expires_at", expireAfterSeconds=0)],
+    "story_views": [
+        IndexModel([("viewer_id", 1), ("author_id", 1)], unique=True),
+        IndexModel("expires_at", expireAfterSeconds=0),
+    ],
+}
+
+# createIndexes error for an existing index whose options differ
+INDEX_OPTIONS_CONFLICT = 85
+
+async def create_collection_indexes(name: str, models: List[IndexModel]):
+    try:
+        await db[name].create_indexes(models)
+    except OperationFailure as exc:
+        if exc.code != INDEX_OPTIONS_CONFLICT:
+            raise
+        # A TTL set from the environment changed: update it in place, which
+        # is the only index option collMod can change without a rebuild
+        for model in models:
+            spec = model.document
+            if "expireAfterSeconds" in spec:
+                await db.command({"collMod": name, "index": {
+                    "keyPattern": spec["key"], "expireAfterSeconds": spec["expireAfterSeconds"],
+                }})
+        await db[name].create_indexes(models)
+
+async def create_indexes():
+    """One createIndexes command per collection, all in flight at once."""
+    await asyncio.gather(*(create_collection_indexes(name, models) for name, models in INDEXES.items()))
+
+# Feed cursors
+def as_datetime(value: Union[datetime, str]) -> datetime:
+    """Normalize a stored timestamp to an aware UTC datetime."""
+    # ISO strings remain on documents backend/migrate.py has not reached yet
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    # Documents read without tz_aware come back naive; BSON dates are always UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+def epoch_ms(value: Union[datetime, str]) -> int:
+    return int(as_datetime(value).timestamp() * 1000)
+
+def encode_cursor(created_at: datetime, item_id: str) -> str:
+    raw = json.dumps([epoch_ms(created_at), item_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        millis, item_id = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(millis, int) or not isinstance(item_id, str):
+            raise TypeError
+        created_at = datetime.fromtimestamp(millis / 1000, tz=timezone.utc)
+    except (ValueError, TypeError, OverflowError, OSError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return created_at, item_id
+
+def after_cursor(created_at: datetime, item_id: str, id_field: str = "id") -> dict:
+    # Keyset predicate matching FEED_SORT, so each page is an index range scan
+    return {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, id_field: {"$lt": item_id}},
+    ]}
+
+def paginate(docs: list, limit: int, id_field: str = "id"):
+    """Trim a limit+1 fetch to one page and return (page, next_cursor)."""
+    if len(docs) <= limit:
+        return docs, None
+    docs = docs[:limit]
+    return docs, encode_cursor(docs[-1]["created_at"], docs[-1][id_field])
+
+# Write-behind post counters
+class CounterBuffer:
+    """Coalesces likes/saves/comments counter increments per post.
+
+    Deltas accumulate in memory and are flushed as one unordered bulk_write of
+    $inc operations every `interval` seconds, or sooner once `max_pending`
+    posts are dirty. Reads call apply() to add deltas that have not reached
+    MongoDB yet.
+    """
+
+    def __init__(self, interval: float = 1.0, max_pending: int = 1000):
+        self.interval = interval
+        self.max_pending = max_pending
+        self.pending = {}
+        self._in_flight = {}
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self._stopping = False
+
+    def add(self, post_id: str, field: str, delta: int):
+        if not delta:
+            return
+        fields = self.pending.setdefault(post_id, {})
+        fields[field] = fields.get(field, 0) + delta
+        if len(self.pending) >= self.max_pending:
+            self._wakeup.set()
+
+    def delta(self, post_id: str, field: str) -> int:
+        return sum(buf.get(post_id, {}).get(field, 0) for buf in (self._in_flight, self.pending))
+
+    def apply(self, docs: list, id_field: str = "id") -> list:
+        """Add unflushed deltas to the counters of already-fetched documents."""
+        if not self.pending and not self._in_flight:
+            return docs
+        for doc in docs:
+            for buf in (self._in_flight, self.pending):
+                for field, delta in buf.get(doc[id_field], {}).items():
+                    if field in doc:
+                        doc[field] += delta
+        return docs
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self.pending:
+                return
+            self._in_flight, self.pending = self.pending, {}
+            try:
+                await db.posts.bulk_write(
+                    [UpdateOne({"id": post_id}, {"$inc": fields}) for post_id, fields in self._in_flight.items()],
+                    ordered=False,
+                )
+            except Exception:
+                logger.exception("Counter flush failed; keeping %d posts pending", len(self._in_flight))
+                self._requeue()
+                return
+            # Written: from here on the deltas are in MongoDB, not ours to apply
+            flushed, self._in_flight = self._in_flight, {}
+        try:
+            # Cached copies were read before the flush landed, and other
+            # workers served the pre-flush counts under the current ETags
+            await cache.invalidate("reels", *(f"post:{post_id}" for post_id in flushed))
+            await cache.bump("posts")
+        except Exception:
+            logger.exception("Cache invalidation after counter flush failed")
+
+    async def discard(self):
+        """Drop every buffered delta, once any flush in progress has landed."""
+        async with self._flush_lock:
+            self.pending = {}
+
+    def _requeue(self):
+        """Move the deltas of a flush that did not complete back into pending."""
+        for post_id, fields in self._in_flight.items():
+            for field, delta in fields.items():
+                self.add(post_id, field, delta)
+        self._in_flight = {}
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Counter flush raised; retrying next interval")
+
+    def start(self):
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Let a flush in progress finish, then write everything still pending."""
+        task, self._task = self._task, None
+        if task:
+            # Stopping between flushes rather than cancelling one midway, where
+            # it is unknown whether the bulk_write was applied
+            self._stopping = True
+            self._wakeup.set()
+            await task
+        if self._in_flight:
+            # Only if the worker was cancelled from outside mid-flush
+            self._requeue()
+        await self.flush()
+
+counters = CounterBuffer(
+    float(os.environ.get("COUNTER_FLUSH_INTERVAL", "1.0")),
+    int(os.environ.get("COUNTER_FLUSH_MAX_PENDING", "1000")),
+)
+
+# Like/save edges
+async def toggle_edge(edges, counter: str, viewer_id: str, post_id: str):
+    """Flip a (user_id, post_id) edge and buffer the net change to the post counter.
+
+    Returns (active, current count, post author).
+
+    Removing an edge costs one round trip: the post is read concurrently with
+    the delete. Adding one costs a second, because whether to insert depends
+    on the delete finding nothing; a single upsert can insert or keep an edge
+    but never remove it, so presence-based edges cannot toggle in one command.
+    """
+    edge = {"user_id": viewer_id, "post_id": post_id}
+    # Deleting before the post is known to exist is harmless: at worst it
+    # drops an edge left behind by a deleted post
+    post, removed = await asyncio.gather(
+        db.posts.find_one({"id": post_id}, {"_id": 0, "user_id": 1, counter: 1}),
+        edges.delete_one(edge),
+    )
+    if not post:
+        raise HTTPException(status_code=404, detail="Post not found")
+    if removed.deleted_count:
+        active, delta = False, -1
+    else:
+        result = await edges.update_one(edge, {"$setOnInsert": {"created_at": utcnow()}}, upsert=True)
+        # A concurrent toggle may have inserted the edge first; only count our own insert
+        active, delta = True, 1 if result.upserted_id is not None else 0
+    counters.add(post_id, counter, delta)
+    trending.record(post_id, counter, delta)
+    await cache.bump(edges.name, "posts")
+    return active, post.get(counter, 0) + counters.delta(post_id, counter), post["user_id"]
+
+async def annotate_viewer_flags(posts: list, viewer_id: str) -> list:
+    """Set is_liked/is_saved on each post for this viewer in one query per edge type."""
+    if not posts:
+        return posts
+    edge_query = {"user_id": viewer_id, "post_id": {"$in": [p["id"] for p in posts]}}
+    liked, saved = await asyncio.gather(
+        db.likes.distinct("post_id", edge_query),
+        db.saves.distinct("post_id", edge_query),
+    )
+    liked, saved = set(liked), set(saved)
+    for p in posts:
+        p["is_liked"] = p["id"] in liked
+        p["is_saved"] = p["id"] in saved
+    return posts
+
+# Comment previews
+COMMENT_PREVIEW_SIZE = 2
+# Cleared the first time the server rejects $lookup with both localField and
+# pipeline (MongoDB < 5.0); previews then use one bounded find per post
+preview_lookup_supported = True
+
+async def latest_comments_by_lookup(post_ids: List[str]) -> dict:
+    """One aggregation; each post's lookup reads at most COMMENT_PREVIEW_SIZE index entries."""
+    rows = await db.posts.aggregate([
+        {"$match": {"id": {"$in": post_ids}}},
+        {"$project": {"_id": 0, "id": 1}},
+        {"$lookup": {
+            "from": "comments",
+            "localField": "id",
+            "foreignField": "post_id",
+            "pipeline": [
+                {"$sort": dict(FEED_SORT)},
+                {"$limit": COMMENT_PREVIEW_SIZE},
+                {"$project": {"_id": 0}},
+            ],
+            "as": "latest_comments",
+        }},
+    ]).to_list(len(post_ids))
+    return {row["id"]: row["latest_comments"] for row in rows}
+
+async def latest_comments_by_find(post_ids: List[str]) -> dict:
+    """Same index reads as the lookup, as one query per post run concurrently."""
+    pages = await asyncio.gather(*(
+        db.comments.find({"post_id": post_id}, {"_id": 0}).sort(FEED_SORT)
+        .limit(COMMENT_PREVIEW_SIZE).to_list(COMMENT_PREVIEW_SIZE)
+        for post_id in post_ids
+    ))
+    return dict(zip(post_ids, pages))
+
+async def attach_comment_previews(posts: list) -> list:
+    """Embed each post's newest comments as latest_comments.
+
+    A $group over the page's comments would read whole threads; both forms
+    here stop after COMMENT_PREVIEW_SIZE entries of the (post_id, created_at,
+    id) index per post. Previews are decoration: if they cannot be loaded the
+    posts are served without them.
+    """
+    global preview_lookup_supported
+    for post in posts:
+        post["latest_comments"] = []
+    if not posts:
+        return posts
+    post_ids = [p["id"] for p in posts]
+    try:
+        if preview_lookup_supported:
+            try:
+                previews = await latest_comments_by_lookup(post_ids)
+            except (OperationFailure, NotImplementedError) as exc:
+                preview_lookup_supported = False
+                logger.warning("Comment preview $lookup unsupported, using a query per post: %s", exc)
+                previews = await latest_comments_by_find(post_ids)
+        else:
+            previews = await latest_comments_by_find(post_ids)
+    except Exception as exc:
+        logger.warning("Comment previews unavailable: %s", exc)
+        return posts
+    await hydrate_authors([c for comments in previews.values() for c in comments])
+    for post in posts:
+        post["latest_comments"] = previews.get(post["id"], [])
+    return posts
+
+# Author hydration
+AUTHOR_FIELDS = {"_id": 0, "id": 1, "username": 1, "avatar_url": 1}
+AUTHOR_TTL = 60
+
+author_cache = ResponseCache(int(os.environ.get("AUTHOR_CACHE_MAX_ENTRIES", "4096")))
+
+async def hydrate_authors(docs: list) -> list:
+    """Fill username/user_avatar from users with at most one $in query.
+
+    Authors missing from users keep whatever the document itself carries, so
+    legacy denormalized documents still render.
+    """
+    authors = {}
+    missing = set()
+    for user_id in {d["user_id"] for d in docs}:
+        author = author_cache.get(f"author:{user_id}")
+        if author is None:
+            missing.add(user_id)
+        else:
+            authors[user_id] = author
+    if missing:
+        async for user in db.users.find({"id": {"$in": list(missing)}}, AUTHOR_FIELDS):
+            author = {"username": user["username"], "user_avatar": user["avatar_url"]}
+            author_cache.set(f"author:{user['id']}", author, AUTHOR_TTL)
+            authors[user["id"]] = author
+    for d in docs:
+        d.update(authors.get(d["user_id"], ()))
+    return docs
+
+# Home timelines
+# Posts by authors with at most this many followers are pushed into each
+# follower's timeline on write; bigger accounts are merged in on read.
+# Entries older than TIMELINE_TTL are removed by a TTL index, and pulled
+# posts are read over the same window, so the home feed ends there.
+FANOUT_MAX_FOLLOWERS = int(os.environ.get("FANOUT_MAX_FOLLOWERS", "10000"))
+TIMELINE_BACKFILL = 20
+
+def timeline_entry(owner_id: str, post: dict) -> dict:
+    return {
+        "owner_id": owner_id,
+        "post_id": post["id"],
+        "author_id": post["user_id"],
+        "created_at": as_datetime(post["created_at"]),
+    }
+
+async def fan_out_post(post: dict):
+    """Push a new post into the timeline of every follower of its author."""
+    batch = []
+    async for edge in db.follows.find({"followee_id": post["user_id"]}, {"_id": 0, "follower_id": 1}):
+        batch.append(timeline_entry(edge["follower_id"], post))
+        if len(batch) >= BULK_BATCH_SIZE:
+            await db.timelines.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        await db.timelines.insert_many(batch, ordered=False)
+
+async def pull_sources(viewer_id: str) -> list:
+    """Authors read at request time: the viewer plus followees too big to fan out."""
+    async def load():
+        followees = await db.follows.distinct("followee_id", {"follower_id": viewer_id})
+        big = await db.users.distinct(
+            "id", {"id": {"$in": followees}, "followers_count": {"$gt": FANOUT_MAX_FOLLOWERS}}
+        )
+        return [viewer_id, *big]
+    return await cached(f"pull:{viewer_id}", load)
+
+async def home_timeline_page(viewer_id: str, cursor: Optional[str], limit: int):
+    """Merge the materialized timeline with pulled authors' recent posts."""
+    position = decode_cursor(cursor) if cursor else None
+    entry_query = {"owner_id": viewer_id}
+    post_query = {
+        "user_id": {"$in": await pull_sources(viewer_id)},
+        "created_at": {"$gte": utcnow() - TIMELINE_TTL},
+    }
+    if position:
+        entry_query.update(after_cursor(*position, id_field="post_id"))
+        post_query.update(after_cursor(*position))
+    entries, pulled = await asyncio.gather(
+        db.timelines.find(entry_query, {"_id": 0, "post_id": 1, "created_at": 1})
+        .sort(SAVED_SORT).limit(limit + 1).to_list(limit + 1),
+        db.posts.find(post_query, {"_id": 0}).sort(FEED_SORT).limit(limit + 1).to_list(limit + 1),
+    )
+    keys = {(as_datetime(p["created_at"]), p["id"]) for p in pulled}
+    keys.update((as_datetime(e["created_at"]), e["post_id"]) for e in entries)
+    page = sorted(keys, reverse=True)[:limit + 1]
+    by_id = {p["id"]: p for p in pulled}
+    missing = [post_id for _, post_id in page if post_id not in by_id]
+    if missing:
+        async for post in db.posts.find({"id": {"$in": missing}}, {"_id": 0}):
+            by_id[post["id"]] = post
+    posts = [by_id[post_id] for _, post_id in page if post_id in by_id]
+    return paginate(posts, limit)
+
+async def home_feed_page(viewer_id: str, cursor: Optional[str], limit: int) -> dict:
+    posts, next_cursor = await home_timeline_page(viewer_id, cursor, limit)
+    counters.apply(posts)
+    await asyncio.gather(
+        hydrate_authors(posts), annotate_viewer_flags(posts, viewer_id), attach_comment_previews(posts)
+    )
+    return {"posts": posts, "next_cursor": next_cursor}
+
+# Stories
+# A viewer's seen state is one document per author they have watched:
+# seen_until is the newest story seen, so "seen" means nothing newer exists.
+# Each marker expires with the story it covers.
+STORY_RAIL_SIZE = 50
+
+def story_view(viewer_id: str, story: dict) -> dict:
+    return {
+        "viewer_id": viewer_id,
+        "author_id": story["user_id"],
+        "seen_until": story["created_at"],
+        "expires_at": story["expires_at"],
+    }
+
+async def load_story_rail() -> list:
+    """Newest live story per author with the author's story count, newest first."""
+    rail = await db.stories.aggregate([
+        {"$match": {"expires_at": {"$gt": utcnow()}}},
+        {"$sort": {"created_at": -1}},
+        {"$group": {"_id": "$user_id", "story": {"$first": "$$ROOT"}, "story_count": {"$sum": 1}}},
+        {"$sort": {"story.created_at": -1}},
+        {"$limit": STORY_RAIL_SIZE},
+    ]).to_list(STORY_RAIL_SIZE)
+    stories = []
+    for entry in rail:
+        story = entry["story"]
+        story.pop("_id", None)
+        stories.append({**story, "story_count": entry["story_count"]})
+    return await hydrate_authors(stories)
+
+async def stories_for_viewer(viewer_id: str) -> list:
+    """The shared rail with this viewer's seen flags, unseen authors first."""
+    rail = await cached("stories", load_story_rail)
+    views = await db.story_views.find(
+        {"viewer_id": viewer_id, "author_id": {"$in": [s["user_id"] for s in rail]}},
+        {"_id": 0, "author_id": 1, "seen_until": 1},
+    ).to_list(len(rail))
+    seen_until = {v["author_id"]: epoch_ms(v["seen_until"]) for v in views}
+    stories = [{**s, "is_seen": seen_until.get(s["user_id"], -1) >= epoch_ms(s["created_at"])} for s in rail]
+    # Stable sort keeps newest-first within the unseen and seen groups
+    return sorted(stories, key=lambda s: s["is_seen"])
+
+# Bulk loading
+SEEDED_COLLECTIONS = (
+    "users", "posts", "stories", "story_views", "comments", "explore", "likes", "saves", "follows", "timelines",
+)
+BULK_BATCH_SIZE = 5000
+
+def seed_dataset() -> Dict[str, Iterable[dict]]:
+    users = [User(**u).model_dump() for u in SEED_USERS]
+    posts = [Post(**p).model_dump() for p in SEED_POSTS]
+    now = utcnow()
+    follows = [{**f, "created_at": now} for f in SEED_FOLLOWS]
+    stories = [Story(**s).model_dump() for s in SEED_STORIES]
+    # Materialize what create_post would have fanned out for the seeded posts
+    fanned_out = {u["id"] for u in users if u["followers_count"] <= FANOUT_MAX_FOLLOWERS}
+    timelines = [
+        timeline_entry(f["follower_id"], p)
+        for f in follows for p in posts
+        if p["user_id"] == f["followee_id"] and p["user_id"] in fanned_out
+    ]
+    return {
+        "users": users,
+        "posts": posts,
+        "stories": stories,
+        "story_views": [
+            story_view(CURRENT_USER_ID, story)
+            for story, seed in zip(stories, SEED_STORIES) if seed["is_seen"]
+        ],
+        "comments": [Comment(**c).model_dump() for c in SEED_COMMENTS],
+        "explore": [{"id": "explore_data", "images": EXPLORE_IMAGES}],
+        "follows": follows,
+        "timelines": timelines,
+    }
+
+def synthetic_dataset(users: int, posts: int, comments: int = 0, seed: int = 0) -> Dict[str, Iterable[dict]]:
+    """Lazily generate load-test documents shaped like the models.
+
+    Documents are built as plain dicts (no per-document validation) so that
+    millions of rows can be streamed straight into insert_many batches.
+    """
+    if posts and not users:
+        raise ValueError("synthetic posts need at least one synthetic user")
+    now = utcnow()
+
+    def gen_users():
+        rng = random.Random(seed)
+        for i in range(users):
+            yield {
+                "id": f"synth_user_{i}",
+                "username": f"synth.user{i}",
+                "display_name": f"Synthetic User {i}",
+                "avatar_url": f"https://i.pravatar.cc/150?u=synth_user_{i}",
+                "bio": "",
+                "posts_count": 0,
+                "followers_count": rng.randint(0, 50000),
+                "following_count": rng.randint(0, 2000),
+                "is_verified": rng.random() < 0.05,
+                "created_at": now - timedelta(days=rng.randint(30, 900)),
+            }
+
+    def gen_posts():
+        rng = random.Random(seed + 1)
+        for i in range(posts):
+            yield {
+                "id": f"synth_post_{i}",
+                "user_id": f"synth_user_{rng.randrange(users)}",
+                "image_url": rng.choice(EXPLORE_IMAGES),
+                "caption": f"Synthetic post {i}",
+                "likes_count": rng.randint(0, 5000),
+                "comments_count": 0,
+                "saves_count": rng.randint(0, 500),
+                "location": "",
+                "created_at": now - timedelta(seconds=i * 7),
+            }
+
+    def gen_comments():
+        rng = random.Random(seed + 2)
+        for i in range(comments):
+            yield {
+                "id": f"synth_comment_{i}",
+                "post_id": f"synth_post_{rng.randrange(posts)}",
+                "user_id": f"synth_user_{rng.randrange(users)}",
+                "text": f"Synthetic comment {i}",
+                "created_at": now - timedelta(seconds=i * 3),
+            }
+
+    dataset = {"users": gen_users(), "posts": gen_posts()}
+    if comments and posts:
+        dataset["comments"] = gen_comments()
+    return dataset
+
+async def bulk_insert(collection, docs: Iterable[dict], batch_size: int = BULK_BATCH_SIZE) -> int:
+    """insert_many in unordered batches; returns the number of documents written."""
+    docs = iter(docs)
+    inserted = 0
+    while batch := list(islice(docs, batch_size)):
+        await collection.insert_many(batch, ordered=False)
+        inserted += len(batch)
+    return inserted
+
+async def load_datasets(*datasets: Dict[str, Iterable[dict]]) -> Dict[str, int]:
+    """Load every collection concurrently; datasets for the same collection load in order."""
+    by_collection = {}
+    for dataset in datasets:
+        for name, docs in dataset.items():
+            by_collection.setdefault(name, []).append(docs)
+
+    async def load(name, sources):
+        return sum([await bulk_insert(db[name], docs) for docs in sources])
+
+    counts = await asyncio.gather(*(load(name, sources) for name, sources in by_collection.items()))
+    return dict(zip(by_collection, counts))
+
+async def clear_seeded_collections():
+    await asyncio.gather(*(db[name].delete_many({}) for name in SEEDED_COLLECTIONS))
+
+# Profile grids
+GRID_FIELDS = {"_id": 0, "id": 1, "image_url": 1, "likes_count": 1, "comments_count": 1, "created_at": 1}
+GRID_PAGE_SIZE = 12
+
+async def user_posts_page(user_id: str, cursor: Optional[str], limit: int):
+    query = {"user_id": user_id}
+    if cursor:
+        query.update(after_cursor(*decode_cursor(cursor)))
+    posts = await db.posts.find(query, GRID_FIELDS).sort(FEED_SORT).limit(limit + 1).to_list(limit + 1)
+    return paginate(counters.apply(posts), limit)
+
+async def saved_posts_page(user_id: str, cursor: Optional[str], limit: int):
+    """Page through a user's saves newest-first, joining grid fields in one aggregation."""
+    match = {"user_id": user_id}
+    if cursor:
+        match.update(after_cursor(*decode_cursor(cursor), id_field="post_id"))
+    edges = await db.saves.aggregate([
+        {"$match": match},
+        {"$sort": dict(SAVED_SORT)},
+        {"$limit": limit + 1},
+        {"$lookup": {"from": "posts", "localField": "post_id", "foreignField": "id", "as": "post"}},
+        {"$project": {"_id": 0, "post_id": 1, "created_at": 1, **{f"post.{f}": 1 for f in GRID_FIELDS if f != "_id"}}},
+    ]).to_list(limit + 1)
+    edges, next_cursor = paginate(edges, limit, id_field="post_id")
+    # Saves whose post was deleted join to nothing and are skipped
+    return counters.apply([e["post"][0] for e in edges if e["post"]]), next_cursor
+
+# NDJSON streaming
+# Clients opt in with "Accept: application/x-ndjson"; documents are written as
+# the Motor cursor yields them, so memory per request is bounded by one batch.
+NDJSON = "application/x-ndjson"
+STREAM_BATCH_SIZE = 500
+
+def wants_ndjson(request: Request) -> bool:
+    return NDJSON in request.headers.get("accept", "")
+
+def ndjson_response(cursor, transform=None) -> StreamingResponse:
+    """Stream a cursor as NDJSON, passing each batch through an async transform.
+
+    Open the cursor with batch_size=STREAM_BATCH_SIZE so server batches line up.
+    """
+    async def lines():
+        batch = []
+        async for doc in cursor:
+            batch.append(doc)
+            if len(batch) >= STREAM_BATCH_SIZE:
+                yield await encode_batch(batch)
+                batch = []
+        if batch:
+            yield await encode_batch(batch)
+
+    async def encode_batch(batch):
+        if transform:
+            batch = await transform(batch)
+        return b"".join(orjson.dumps(doc, default=str, option=orjson.OPT_APPEND_NEWLINE) for doc in batch)
+
+    return StreamingResponse(lines(), media_type=NDJSON)
+
+# Live events
+# Clients subscribe over SSE to topics "post:{id}" (likes and comments on a
+# post) and "user:{id}" (new posts by, and activity on the posts of, a user).
+EVENT_SOURCE = os.environ.get("EVENT_SOURCE", "local")  # "local" or "changestream"
+EVENTS_MAX_PENDING = int(os.environ.get("EVENTS_MAX_PENDING", "100"))
+EVENTS_KEEPALIVE_SECONDS = 15
+EVENTS_MAX_TOPICS = 100
+
+class Subscriber:
+    """One client's undelivered events, keyed so newer state replaces older.
+
+    At most `max_pending` keys are held; past that the oldest is dropped and
+    counted, and the client is told to resync.
+    """
+
+    def __init__(self, topics: set, max_pending: int):
+        self.topics = topics
+        self.max_pending = max_pending
+        self.pending = OrderedDict()
+        self.dropped = 0
+        self.ready = asyncio.Event()
+
+    def offer(self, key: str, event: dict):
+        if key not in self.pending and len(self.pending) >= self.max_pending:
+            self.pending.popitem(last=False)
+            self.dropped += 1
+        self.pending[key] = event
+        self.ready.set()
+
+    def drain(self):
+        events, dropped = list(self.pending.values()), self.dropped
+        self.pending.clear()
+        self.dropped = 0
+        self.ready.clear()
+        return events, dropped
+
+class EventBus:
+    """In-process pub/sub between write handlers and connected clients.
+
+    publish() never awaits: it only updates the buffers of the topic's
+    subscribers, so idle clients cost a parked coroutine and a slow one only
+    coalesces its own backlog. With EVENT_SOURCE=changestream, a MongoDB
+    change stream feeds the bus instead of local writes, so every worker sees
+    every write; it falls back to local publishing when the server is not a
+    replica set.
+    """
+
+    def __init__(self, max_pending: int = 100):
+        self.max_pending = max_pending
+        self.topics = {}
+        self.local = True
+        self.subscribers = 0
+        self._task = None
+
+    def subscribe(self, topics: set) -> Subscriber:
+        sub = Subscriber(topics, self.max_pending)
+        for topic in topics:
+            self.topics.setdefault(topic, set()).add(sub)
+        self.subscribers += 1
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        for topic in sub.topics:
+            subs = self.topics.get(topic)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self.topics[topic]
+        self.subscribers -= 1
+
+    def publish(self, topics: Iterable[str], key: str, event: dict):
+        for topic in topics:
+            for sub in self.topics.get(topic, ()):
+                sub.offer(key, event)
+
+    def emit(self, topics: Iterable[str], key: str, event: dict):
+        """Publish from a write handler, unless the change stream will report it."""
+        if self.local:
+            self.publish(topics, key, event)
+
+    async def _watch(self):
+        pipeline = [{"$match": {
+            "ns.coll": {"$in": ["posts", "comments"]},
+            "operationType": {"$in": ["insert", "update"]},
+        }}]
+        resume_token = None
+        while True:
+            try:
+                async with db.watch(pipeline, full_document="updateLookup", resume_after=resume_token) as stream:
+                    self.local = False
+                    logger.info("Live events fed by MongoDB change stream")
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        await self._dispatch(change)
+            except OperationFailure as exc:
+                self.local = True
+                if exc.code == 40573:  # change streams need a replica set
+                    logger.warning("Change streams unavailable; publishing live events locally")
+                    return
+                logger.exception("Change stream failed; retrying")
+            except Exception:
+                self.local = True
+                logger.exception("Change stream failed; retrying")
+            await asyncio.sleep(5)
+
+    async def _dispatch(self, change: dict):
+        doc = change.get("fullDocument")
+        if not doc:
+            return
+        doc.pop("_id", None)
+        if change["ns"]["coll"] == "comments":
+            post = await db.posts.find_one({"id": doc["post_id"]}, {"_id": 0, "user_id": 1})
+            if post:
+                await hydrate_authors([doc])
+                self.publish(*comment_event(post["user_id"], doc))
+        elif change["operationType"] == "insert":
+            await hydrate_authors([doc])
+            self.publish(*post_event(doc))
+        elif "likes_count" in change.get("updateDescription", {}).get("updatedFields", {}):
+            self.publish(*likes_event(doc["id"], doc["user_id"], doc["likes_count"]))
+
+    def start(self, source: str):
+        if source == "changestream":
+            self._task = asyncio.create_task(self._watch())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+
+def likes_event(post_id: str, owner_id: str, likes_count: int):
+    return (
+        (f"post:{post_id}", f"user:{owner_id}"),
+        f"likes:{post_id}",
+        {"type": "post.likes", "post_id": post_id, "likes_count": likes_count},
+    )
+
+def comment_event(owner_id: str, comment: dict):
+    return (
+        (f"post:{comment['post_id']}", f"user:{owner_id}"),
+        f"comment:{comment['id']}",
+        {"type": "comment.created", "post_id": comment["post_id"], "comment": comment},
+    )
+
+def post_event(post: dict):
+    return ((f"user:{post['user_id']}",), f"post:{post['id']}", {"type": "post.created", "post": post})
+
+def sse_message(event: dict) -> bytes:
+    return b"event: " + event["type"].encode() + b"\ndata: " + orjson.dumps(event, default=str) + b"\n\n"
+
+bus = EventBus(EVENTS_MAX_PENDING)
+
+# Comment ingestion
+# Comments are queued and written by one worker: each batch costs one $in
+# lookup of the posts, one insert_many and one grouped $inc per post (through
+# the counter buffer), however many requests it carries.
+COMMENT_QUEUE_SIZE = int(os.environ.get("COMMENT_QUEUE_SIZE", "1000"))
+COMMENT_BATCH_SIZE = int(os.environ.get("COMMENT_BATCH_SIZE", "200"))
+COMMENT_WRITE_TIMEOUT = float(os.environ.get("COMMENT_WRITE_TIMEOUT", "5"))
+COMMENT_BATCH_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 200, 500)
+
+class CommentIngest:
+    """Bounded queue of validated comments drained in bulk.
+
+    submit() rejects with 429 when the queue is full and 503 when the worker
+    is not running, so overload surfaces to clients instead of piling up as
+    pending requests. A comment still queued after `timeout` will be written,
+    so it is reported as accepted rather than failed.
+    """
+
+    def __init__(self, maxsize: int = 1000, batch_size: int = 200, timeout: float = 5.0):
+        self.queue = asyncio.Queue(maxsize)
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self._task = None
+        self._closing = False
+
+    async def submit(self, doc: dict) -> Optional[dict]:
+        """The written comment, or None if it is still queued after `timeout`."""
+        if self._closing or self._task is None or self._task.done():
+            raise HTTPException(status_code=503, detail="Comment ingestion unavailable")
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((doc, future))
+        except asyncio.QueueFull:
+            metrics.inc("comment_rejections_total", "Comments rejected by the ingestion queue", {"status": 429})
+            raise HTTPException(status_code=429, detail="Too many comments, retry shortly", headers={"Retry-After": "1"})
+        try:
+            # shield: a client hanging up must not cancel a write already queued
+            return await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            metrics.inc("comment_deferred_total", "Comments answered before their write landed", {})
+            return None
+
+    def _take_batch(self, first) -> list:
+        batch = [first]
+        while len(batch) < self.batch_size and not self.queue.empty():
+            item = self.queue.get_nowait()
+            if item is None:
+                # close()'s sentinel: nothing was queued after it
+                self.queue.task_done()
+                self._closing = True
+                break
+            batch.append(item)
+        return batch
+
+    async def _write(self, batch: list):
+        post_ids = list({doc["post_id"] for doc, _ in batch})
+        owners = {
+            post["id"]: post["user_id"]
+            async for post in db.posts.find({"id": {"$in": post_ids}}, {"_id": 0, "id": 1, "user_id": 1})
+        }
+        accepted = []
+        for doc, future in batch:
+            if doc["post_id"] not in owners:
+                future.set_exception(HTTPException(status_code=404, detail="Post not found"))
+            else:
+                accepted.append((doc, future))
+        if not accepted:
+            return
+        failed = set()
+        try:
+            await db.comments.insert_many([doc for doc, _ in accepted], ordered=False)
+        except BulkWriteError as exc:
+            failed = {error["index"] for error in exc.details.get("writeErrors", [])}
+        written = []
+        for i, (doc, future) in enumerate(accepted):
+            if i in failed:
+                future.set_exception(HTTPException(status_code=503, detail="Comment write failed"))
+            else:
+                doc.pop("_id", None)
+                written.append((doc, future))
+        per_post = {}
+        for doc, _ in written:
+            per_post[doc["post_id"]] = per_post.get(doc["post_id"], 0) + 1
+        for post_id, count in per_post.items():
+            counters.add(post_id, "comments_count", count)
+            trending.record(post_id, "comments_count", count)
+        if written:
+            await cache.bump("comments", "posts")
+            await hydrate_authors([doc for doc, _ in written])
+        for doc, future in written:
+            bus.emit(*comment_event(owners[doc["post_id"]], doc))
+            future.set_result(doc)
+
+    async def _drain(self, batch: list):
+        try:
+            await self._write(batch)
+        except Exception:
+            logger.exception("Comment batch of %d failed", len(batch))
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(HTTPException(status_code=503, detail="Comment write failed"))
+        finally:
+            for _ in batch:
+                self.queue.task_done()
+        metrics.observe("comment_batch_size", "Comments written per batch", {}, len(batch), COMMENT_BATCH_BUCKETS)
+
+    async def _run(self):
+        # Exits only on the sentinel, never mid-batch, so every insert that
+        # lands is also counted and answered
+        while True:
+            first = await self.queue.get()
+            if first is None:
+                self.queue.task_done()
+                return
+            batch = self._take_batch(first)
+            await self._drain(batch)
+            if self._closing and self.queue.empty():
+                return
+
+    def start(self):
+        self._closing = False
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Stop accepting, let the worker finish what is queued, then wait for it."""
+        self._closing = True
+        task, self._task = self._task, None
+        if task and not task.done():
+            await self.queue.put(None)
+            await task
+        # Only reached with items left if the worker had died
+        while not self.queue.empty():
+            item = self.queue.get_nowait()
+            if item is None:
+                self.queue.task_done()
+            else:
+                await self._drain(self._take_batch(item))
+
+comment_ingest = CommentIngest(COMMENT_QUEUE_SIZE, COMMENT_BATCH_SIZE, COMMENT_WRITE_TIMEOUT)
+
+# Batching
+# /api/batch replays GET sub-requests through the app itself, so each one gets
+# the same routing, validation and metrics as a standalone call.
+BATCH_FORWARDED_HEADERS = {b"x-user-id", b"user-agent", b"host"}
+PROFILE_HEADER_FIELDS = {"_id": 0, "id": 1, "username": 1, "display_name": 1, "avatar_url": 1, "is_verified": 1}
+# Routes whose responses never finish (or recurse) cannot be collected into a batch
+BATCH_EXCLUDED_PATHS = ("/api/batch", "/api/events")
+
+async def dispatch_get(request: Request, path: str) -> dict:
+    """Run one GET through the ASGI app in-process; returns {status, body}."""
+    url = urlsplit(path)
+    scope = {
+        **{k: v for k, v in request.scope.items() if k in ("asgi", "http_version", "scheme", "server", "client")},
+        "type": "http",
+        "method": "GET",
+        "root_path": "",
+        "path": url.path,
+        "raw_path": url.path.encode(),
+        "query_string": url.query.encode(),
+        "headers": [(k, v) for k, v in request.scope["headers"] if k in BATCH_FORWARDED_HEADERS],
+    }
+    response = {"status": 500, "body": b""}
+    messages = [{"type": "http.request", "body": b"", "more_body": False}]
+
+    async def receive():
+        # One empty body, then disconnect, as a real server reports a client
+        # that has gone; anything still listening stops instead of spinning
+        return messages.pop() if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+
+    try:
+        await app(scope, receive, send)
+    except Exception:
+        # ServerErrorMiddleware has already sent the 500; keep the rest of the batch
+        logger.exception("Batched request failed: %s", path)
+    body = response["body"]
+    try:
+        return {"status": response["status"], "body": orjson.loads(body) if body else None}
+    except orjson.JSONDecodeError:
+        return {"status": response["status"], "body": body.decode(errors="replace")}
+
 # Seed on startup
-@app.on_event("startup")
+SEED_ON_STARTUP = os.environ.get("SEED_ON_STARTUP", "1") == "1"
+
 async def seed_data():
-    users_count = await db.users.count_documents({})
-    if users_count == 0:
-        for u in SEED_USERS:
-            user = User(**u)
-            await db.users.insert_one(user.model_dump())
-        for p in SEED_POSTS:
-            post = Post(**p)
-            await db.posts.insert_one(post.model_dump())
-        for s in SEED_STORIES:
-            story = Story(**s)
-            await db.stories.insert_one(story.model_dump())
-        for c in SEED_COMMENTS:
-            comment = Comment(**c)
-            await db.comments.insert_one(comment.model_dump())
-        # Store explore images
-        await db.explore.insert_one({"id": "explore_data", "images": EXPLORE_IMAGES})
+    # One indexed point read instead of counting the collection on every boot
+    if await db.users.find_one({}, {"_id": 1}) is None:
+        await load_datasets(seed_dataset())
         logger.info("Database seeded successfully")
 
+# Trending
+# Explore ranks posts by time-decayed engagement:
+#   score = (likes + 3*comments + 5*saves + 1) / (age_hours + 2) ** gravity
+TRENDING_TOP_K = int(os.environ.get("TRENDING_TOP_K", "24"))
+TRENDING_GRAVITY = float(os.environ.get("TRENDING_GRAVITY", "1.5"))
+TRENDING_REFRESH_SECONDS = float(os.environ.get("TRENDING_REFRESH_SECONDS", "60"))
+# Curated images pad Explore while there are fewer ranked posts than this
+EXPLORE_MIN_IMAGES = 12
+
+class TrendingIndex:
+    """Materialized top-K of posts by trending score.
+
+    Counters and creation times live in NumPy arrays, so a full rescore is a
+    few vectorized passes. Engagement events rescore only their own post and
+    splice it into the top-K; a background task rescores everything every
+    `interval` seconds (ages keep moving) and persists the top-K, which a
+    restarted process serves until its own load finishes.
+    """
+
+    FIELDS = ("likes_count", "comments_count", "saves_count")
+    WEIGHTS = np.array([1.0, 3.0, 5.0])
+
+    def __init__(self, k: int = 24, gravity: float = 1.5, interval: float = 60.0):
+        self.k = k
+        self.gravity = gravity
+        self.interval = interval
+        self.ids = []
+        self.images = []
+        self.slots = {}
+        self._counts = np.zeros((0, len(self.FIELDS)))
+        self._created = np.zeros(0)
+        self._size = 0
+        self.top = []  # [(score, slot)], best first
+        self.persisted = []
+        self.ready = False
+        self.version = 0
+        # Tags from another process never match ours, so ETags stay per-index
+        self.epoch = uuid.uuid4().hex[:8]
+        self._loading = None  # (slots, rows, late posts) while load() is reading posts
+        self._load_lock = asyncio.Lock()
+        self._task = None
+
+    def _scores(self, counts, created, now: float):
+        age_hours = np.maximum(now - created, 0.0) / 3600.0
+        return (counts @ self.WEIGHTS + 1.0) / (age_hours + 2.0) ** self.gravity
+
+    async def load(self):
+        """Rebuild the arrays from posts, folding in unflushed counter deltas."""
+        async with self._load_lock:
+            slots, rows, late, ids, images, created = {}, [], [], [], [], []
+            self._loading = (slots, rows, late)
+            projection = {"_id": 0, "id": 1, "image_url": 1, "created_at": 1, **{f: 1 for f in self.FIELDS}}
+            try:
+                cursor = db.posts.find({}, projection, batch_size=STREAM_BATCH_SIZE)
+                while batch := await cursor.to_list(STREAM_BATCH_SIZE):
+                    # Events for posts already read are applied to rows by record();
+                    # later posts pick them up here through the counter buffer
+                    for doc in counters.apply(batch):
+                        if doc["id"] in slots:
+                            continue
+                        slots[doc["id"]] = len(ids)
+                        ids.append(doc["id"])
+                        images.append(doc.get("image_url", ""))
+                        rows.append([doc.get(f, 0) for f in self.FIELDS])
+                        created.append(epoch_ms(doc["created_at"]) / 1000)
+            finally:
+                self._loading = None
+            self.ids, self.images, self.slots = ids, images, slots
+            self._counts = np.array(rows, dtype=float).reshape(-1, len(self.FIELDS))
+            self._created = np.array(created, dtype=float)
+            self._size = len(ids)
+            for post in late:
+                if post["id"] not in self.slots:
+                    self._append(post)
+            self.ready = True
+            self.refresh()
+
+    def refresh(self):
+        """Rescore every post and rebuild the top-K."""
+        n = self._size
+        if n:
+            scores = self._scores(self._counts[:n], self._created[:n], time.time())
+            k = min(self.k, n)
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best], kind="stable")]
+            self.top = list(zip(scores[best].tolist(), best.tolist()))
+        else:
+            self.top = []
+        self.version += 1
+
+    def _grow(self):
+        capacity = max(1024, 2 * len(self._created))
+        counts = np.zeros((capacity, len(self.FIELDS)))
+        counts[:self._size] = self._counts[:self._size]
+        created = np.zeros(capacity)
+        created[:self._size] = self._created[:self._size]
+        self._counts, self._created = counts, created
+
+    def add_post(self, post: dict):
+        if self._loading is not None:
+            # The load cursor may already be past it; appended once load() swaps in
+            self._loading[2].append(post)
+            return
+        if self.ready and post["id"] not in self.slots:
+            self._promote(self._append(post))
+
+    def _append(self, post: dict) -> int:
+        if self._size == len(self._created):
+            self._grow()
+        slot = self._size
+        self._counts[slot] = [post.get(f, 0) for f in self.FIELDS]
+        self._created[slot] = epoch_ms(post["created_at"]) / 1000
+        self._size += 1
+        self.slots[post["id"]] = slot
+        self.ids.append(post["id"])
+        self.images.append(post.get("image_url", ""))
+        return slot
+
+    def record(self, post_id: str, field: str, delta: int):
+        """Apply one engagement event; O(K) to keep the top-K ordered."""
+        if not delta:
+            return
+        column = self.FIELDS.index(field)
+        if self._loading is not None:
+            slots, rows, _ = self._loading
+            if post_id in slots:
+                rows[slots[post_id]][column] += delta
+            return
+        slot = self.slots.get(post_id)
+        if slot is None:
+            return
+        self._counts[slot, column] += delta
+        self._promote(slot)
+
+    def _promote(self, slot: int):
+        score = float(self._scores(self._counts[slot], self._created[slot], time.time()))
+        top = [entry for entry in self.top if entry[1] != slot]
+        if len(top) < self.k or score > top[-1][0]:
+            bisect.insort(top, (score, slot), key=lambda entry: -entry[0])
+            del top[self.k:]
+        elif len(top) == len(self.top):
+            return
+        self.top = top
+        self.version += 1
+
+    def snapshot(self) -> list:
+        return [
+            {"id": self.ids[slot], "image_url": self.images[slot], "score": round(score, 6)}
+            for score, slot in self.top
+        ]
+
+    def posts(self) -> list:
+        return self.snapshot() if self.ready else self.persisted
+
+    def tag(self) -> str:
+        return f"{self.epoch}:{self.version}"
+
+    async def persist(self):
+        await db.explore.update_one(
+            {"id": "trending"},
+            {"$set": {"posts": self.snapshot(), "computed_at": utcnow()}},
+            upsert=True,
+        )
+
+    async def restore(self):
+        doc = await db.explore.find_one({"id": "trending"}, {"_id": 0, "posts": 1})
+        self.persisted = doc["posts"] if doc else []
+        self.version += 1
+
+    async def _run(self):
+        while True:
+            try:
+                if self.ready:
+                    self.refresh()
+                else:
+                    await self.load()
+                await self.persist()
+            except Exception:
+                logger.exception("Trending refresh failed")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        await self.restore()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        task, self._task = self._task, None
+        if task:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+        if self.ready:
+            await self.persist()
+
+trending = TrendingIndex(TRENDING_TOP_K, TRENDING_GRAVITY, TRENDING_REFRESH_SECONDS)
+
+# Search
+# Field weights per searchable collection; every query term matches as a prefix
+SEARCH_FIELDS = {
+    "users": {"username": 3.0, "display_name": 2.0},
+    "posts": {"location": 1.5, "caption": 1.0},
+}
+# Vocabulary tokens a single prefix may expand to (bounds one-letter queries);
+# past this, the completions found in the most documents are kept
+SEARCH_PREFIX_EXPANSIONS = 64
+SEARCH_TOKEN = re.compile(r"[^\W_]+")
+
+def search_tokens(text: str) -> List[str]:
+    return SEARCH_TOKEN.findall(text.lower())
+
+class SearchIndex:
+    """Inverted index over SEARCH_FIELDS with prefix lookup on a sorted vocabulary.
+
+    postings maps token -> {(kind, id): weight}. Prefix terms bisect into the
+    sorted vocabulary; tokens added since the last query are merged in lazily,
+    so bulk builds do not pay for keeping it sorted.
+    """
+
+    def __init__(self):
+        self.postings = {}
+        self.boost = {}
+        self.vocab = []
+        self._new_tokens = []
+        self._expansions = {}
+        self._build_lock = asyncio.Lock()
+        self._task = None
+
+    def clear(self):
+        self.postings, self.boost, self.vocab, self._new_tokens = {}, {}, [], []
+        self._expansions = {}
+
+    def add(self, kind: str, doc: dict):
+        key = (kind, doc["id"])
+        weights = {}
+        for field, weight in SEARCH_FIELDS[kind].items():
+            text = doc.get(field) or ""
+            tokens = search_tokens(text)
+            if field == "username":
+                tokens.append(text.lower())
+            for token in tokens:
+                weights[token] = max(weights.get(token, 0.0), weight)
+        for token, weight in weights.items():
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = {}
+                self._new_tokens.append(token)
+            posting[key] = weight
+        popularity = doc.get("followers_count" if kind == "users" else "likes_count", 0)
+        self.boost[key] = math.log1p(max(popularity, 0)) / 10
+
+    def _expand(self, term: str):
+        """Return (tokens starting with `term`, whether some were left out)."""
+        if self._new_tokens:
+            self.vocab.extend(self._new_tokens)
+            self.vocab.sort()
+            self._new_tokens = []
+            self._expansions = {}
+        start = bisect.bisect_left(self.vocab, term)
+        end = bisect.bisect_left(self.vocab, term[:-1] + chr(ord(term[-1]) + 1), start)
+        if end - start <= SEARCH_PREFIX_EXPANSIONS:
+            return self.vocab[start:end], False
+        # Cached until the vocabulary changes, so a hot short prefix does not
+        # rescan its range on every keystroke
+        tokens = self._expansions.get(term)
+        if tokens is None:
+            tokens = heapq.nlargest(
+                SEARCH_PREFIX_EXPANSIONS, self.vocab[start:end], key=lambda token: len(self.postings[token])
+            )
+            if term in self.postings and term not in tokens:
+                tokens[-1] = term
+            self._expansions[term] = tokens
+        return tokens, True
+
+    def search(self, query: str, kinds: Iterable[str], limit: int, offset: int = 0):
+        """Return ([(score, kind, id)] best first, truncated); every term must match.
+
+        truncated is set when a prefix matched more tokens than were expanded,
+        i.e. rarer completions may be missing from the results.
+        """
+        terms = list(dict.fromkeys(search_tokens(query)))
+        if not terms:
+            return [], False
+        kinds = set(kinds)
+        scores = None
+        truncated = False
+        for term in terms:
+            matched = {}
+            tokens, partial = self._expand(term)
+            truncated = truncated or partial
+            for token in tokens:
+                # Whole-word matches outrank completions
+                factor = 1.0 if token == term else 0.6
+                for key, weight in self.postings[token].items():
+                    if key[0] in kinds and weight * factor > matched.get(key, 0.0):
+                        matched[key] = weight * factor
+            if scores is None:
+                scores = matched
+            else:
+                scores = {key: score + matched[key] for key, score in scores.items() if key in matched}
+            if not scores:
+                return [], truncated
+        ranked = heapq.nlargest(
+            offset + limit,
+            ((score + self.boost.get(key, 0.0), key) for key, score in scores.items()),
+        )
+        return [(score, kind, item_id) for score, (kind, item_id) in ranked[offset:]], truncated
+
+    async def build(self):
+        async with self._build_lock:
+            self.clear()
+            for kind, fields in SEARCH_FIELDS.items():
+                popularity = "followers_count" if kind == "users" else "likes_count"
+                projection = {"_id": 0, "id": 1, popularity: 1, **{f: 1 for f in fields}}
+                cursor = db[kind].find({}, projection, batch_size=STREAM_BATCH_SIZE)
+                while batch := await cursor.to_list(STREAM_BATCH_SIZE):
+                    for doc in batch:
+                        self.add(kind, doc)
+        logger.info("Search index built: %d tokens, %d documents", len(self.postings), len(self.boost))
+
+    def start(self):
+        self._task = asyncio.create_task(self.build())
+
+    async def close(self):
+        """Stop a build still reading from MongoDB, before the client closes."""
+        task, self._task = self._task, None
+        if task and not task.done():
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+
+search_index = SearchIndex()
+
+SEARCH_RESULT_FIELDS = {
+    "users": {"_id": 0, "id": 1, "username": 1, "display_name": 1, "avatar_url": 1, "is_verified": 1, "followers_count": 1},
+    "posts": {**GRID_FIELDS, "user_id": 1, "caption": 1, "location": 1},
+}
+
+async def load_search_hits(kind: str, ids: List[str]) -> Dict[str, dict]:
+    if not ids:
+        return {}
+    docs = await db[kind].find({"id": {"$in": ids}}, SEARCH_RESULT_FIELDS[kind]).to_list(len(ids))
+    if kind == "posts":
+        await hydrate_authors(counters.apply(docs))
+    return {doc["id"]: doc for doc in docs}
+
+# Reels
+# Shaped server-side so no per-post dict is built in Python
+REEL_PROJECTION = {
+    "_id": 0,
+    "id": {"$concat": ["reel_", "$id"]},
+    "post_id": "$id",
+    "user_id": 1,
+    "video_thumbnail": "$image_url",
+    "caption": 1,
+    "likes_count": 1,
+    "comments_count": 1,
+    "music": {"$literal": "Original Audio"},
+}
+
+async def load_reels():
+    reels = await db.posts.aggregate([{"$limit": 20}, {"$project": REEL_PROJECTION}]).to_list(20)
+    return await hydrate_authors(reels)
+
+# Lifecycle
+# Set by the lifespan handler and reported by /api/ready
+READY_PING_TIMEOUT = 1.0
+lifecycle = {"ready": False, "startup_seconds": None}
+
 # Routes
 @api_router.get("/")
 async def root():
     return {"message": "Instagram Clone API"}
 
-@api_router.get("/posts")
-async def get_posts():
-    posts = await db.posts.find({}, {"_id": 0}).sort("created_at", -1).to_list(50)
-    return posts
+@api_router.get("/posts", response_model=PostPage)
+async def get_posts(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=50),
+    viewer_id: str = Depends(get_viewer_id),
+):
+    query = after_cursor(*decode_cursor(cursor)) if cursor else {}
+    if wants_ndjson(request):
+        # Export mode: everything after the cursor, without a page limit
+        async def annotate(batch):
+            counters.apply(batch)
+            await asyncio.gather(hydrate_authors(batch), annotate_viewer_flags(batch, viewer_id))
+            return batch
+        return ndjson_response(
+            db.posts.find(query, {"_id": 0}, batch_size=STREAM_BATCH_SIZE).sort(FEED_SORT), annotate
+        )
+    etag, not_modified = await check_etag(request, "posts", viewer_id)
+    if not_modified:
+        return not_modified
+    posts = await db.posts.find(query, {"_id": 0}).sort(FEED_SORT).limit(limit + 1).to_list(limit + 1)
+    posts, next_cursor = paginate(counters.apply(posts), limit)
+    await asyncio.gather(
+        hydrate_authors(posts), annotate_viewer_flags(posts, viewer_id), attach_comment_previews(posts)
+    )
+    return with_etag(json_response({"posts": posts, "next_cursor": next_cursor}, PostPage), "posts", etag)
 
-@api_router.get("/posts/{post_id}")
-async def get_post(post_id: str):
-    post = await db.posts.find_one({"id": post_id}, {"_id": 0})
+@api_router.post("/posts")
+async def create_post(body: PostCreate, viewer_id: str = Depends(get_viewer_id)):
+    author = await db.users.find_one_and_update(
+        {"id": viewer_id},
+        {"$inc": {"posts_count": 1}},
+        projection={"_id": 0, "followers_count": 1},
+    )
+    if not author:
+        raise HTTPException(status_code=404, detail="User not found")
+    doc = Post(user_id=viewer_id, **body.model_dump()).model_dump()
+    await db.posts.insert_one(doc)
+    doc.pop("_id", None)
+    if author["followers_count"] <= FANOUT_MAX_FOLLOWERS:
+        await fan_out_post(doc)
+    trending.add_post(doc)
+    search_index.add("posts", doc)
+    await cache.invalidate("reels", "users")
+    await cache.bump("posts", "users")
+    await hydrate_authors([doc])
+    bus.emit(*post_event(doc))
+    return {**doc, "is_liked": False, "is_saved": False}
+
+@api_router.get("/feed", response_model=PostPage)
+async def get_home_feed(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=50),
+    viewer_id: str = Depends(get_viewer_id),
+):
+    etag, not_modified = await check_etag(request, "feed", viewer_id)
+    if not_modified:
+        return not_modified
+    return with_etag(json_response(await home_feed_page(viewer_id, cursor, limit), PostPage), "feed", etag)
+
+@api_router.get("/home")
+async def get_home_screen(
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=50),
+    viewer_id: str = Depends(get_viewer_id),
+):
+    """Everything the home screen renders, loaded concurrently in one round trip."""
+    feed, stories, profile = await asyncio.gather(
+        home_feed_page(viewer_id, cursor, limit),
+        stories_for_viewer(viewer_id),
+        db.users.find_one({"id": viewer_id}, PROFILE_HEADER_FIELDS),
+    )
+    return json_response({"feed": feed, "stories": stories, "profile": profile})
+
+@api_router.post("/batch")
+async def batch(body: BatchRequest, request: Request):
+    for sub in body.requests:
+        path = urlsplit(sub.path).path.rstrip("/")
+        if not path.startswith("/api/") or path in BATCH_EXCLUDED_PATHS:
+            raise HTTPException(status_code=400, detail=f"Cannot batch {sub.path}")
+    results = await asyncio.gather(*(dispatch_get(request, sub.path) for sub in body.requests))
+    return json_response({
+        "responses": [{"id": sub.id or sub.path, **result} for sub, result in zip(body.requests, results)],
+    })
+
+@api_router.get("/posts/{post_id}", response_model=PostOut)
+async def get_post(post_id: str, viewer_id: str = Depends(get_viewer_id)):
+    async def load():
+        post = await db.posts.find_one({"id": post_id}, {"_id": 0})
+        return post and (await hydrate_authors([post]))[0]
+    post = await cached(f"post:{post_id}", load)
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
-    return post
+    # Copy before adding per-viewer flags so the cached document stays shared
+    post = dict(post)
+    counters.apply([post])
+    await annotate_viewer_flags([post], viewer_id)
+    return json_response(post, PostOut)
 
 @api_router.post("/posts/{post_id}/like")
-async def toggle_like(post_id: str):
-    post = await db.posts.find_one({"id": post_id}, {"_id": 0})
-    if not post:
-        raise HTTPException(status_code=404, detail="Post not found")
-    new_liked = not post.get("is_liked", False)
-    new_count = post["likes_count"] + (1 if new_liked else -1)
-    await db.posts.update_one(
-        {"id": post_id},
-        {"$set": {"is_liked": new_liked, "likes_count": new_count}}
-    )
-    return {"is_liked": new_liked, "likes_count": new_count}
+async def toggle_like(post_id: str, viewer_id: str = Depends(get_viewer_id)):
+    is_liked, likes_count, owner_id = await toggle_edge(db.likes, "likes_count", viewer_id, post_id)
+    bus.emit(*likes_event(post_id, owner_id, likes_count))
+    return {"is_liked": is_liked, "likes_count": likes_count}
 
 @api_router.post("/posts/{post_id}/save")
-async def toggle_save(post_id: str):
-    post = await db.posts.find_one({"id": post_id}, {"_id": 0})
-    if not post:
-        raise HTTPException(status_code=404, detail="Post not found")
-    new_saved = not post.get("is_saved", False)
-    await db.posts.update_one({"id": post_id}, {"$set": {"is_saved": new_saved}})
-    return {"is_saved": new_saved}
+async def toggle_save(post_id: str, viewer_id: str = Depends(get_viewer_id)):
+    is_saved, _, _ = await toggle_edge(db.saves, "saves_count", viewer_id, post_id)
+    return {"is_saved": is_saved}
 
-@api_router.get("/posts/{post_id}/comments")
-async def get_comments(post_id: str):
-    comments = await db.comments.find({"post_id": post_id}, {"_id": 0}).sort("created_at", -1).to_list(100)
-    return comments
+@api_router.get("/posts/{post_id}/comments", response_model=CommentPage)
+async def get_comments(
+    post_id: str,
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+):
+    query = {"post_id": post_id, **(after_cursor(*decode_cursor(cursor)) if cursor else {})}
+    if wants_ndjson(request):
+        comments = db.comments.find(query, {"_id": 0}, batch_size=STREAM_BATCH_SIZE).sort(FEED_SORT)
+        return ndjson_response(comments, hydrate_authors)
+    comments = await db.comments.find(query, {"_id": 0}).sort(FEED_SORT).limit(limit + 1).to_list(limit + 1)
+    comments, next_cursor = paginate(comments, limit)
+    return json_response({"comments": await hydrate_authors(comments), "next_cursor": next_cursor}, CommentPage)
 
 @api_router.post("/posts/{post_id}/comment")
-async def add_comment(post_id: str, body: CommentCreate):
-    post = await db.posts.find_one({"id": post_id}, {"_id": 0})
-    if not post:
-        raise HTTPException(status_code=404, detail="Post not found")
+async def add_comment(post_id: str, body: CommentCreate, viewer_id: str = Depends(get_viewer_id)):
     comment = Comment(
         post_id=post_id,
-        user_id="current_user",
-        username=body.username,
-        user_avatar=body.user_avatar,
+        user_id=viewer_id,
         text=body.text
     )
-    doc = comment.model_dump()
-    await db.comments.insert_one(doc)
-    await db.posts.update_one({"id": post_id}, {"$inc": {"comments_count": 1}})
-    return {k: v for k, v in doc.items() if k != "_id"}
+    written = await comment_ingest.submit(comment.model_dump())
+    if written is None:
+        # Still queued and will land: an error here would only invite a
+        # retry that posts the comment twice
+        return ORJSONResponse(comment.model_dump(mode="json"), status_code=202)
+    return written
+
+@api_router.get("/stories", response_model=List[StoryOut])
+async def get_stories(request: Request, viewer_id: str = Depends(get_viewer_id)):
+    # Stories expire without a write, so the tag also rolls over every minute
+    etag, not_modified = await check_etag(request, "stories", viewer_id, extra=str(int(time.time() // 60)))
+    if not_modified:
+        return not_modified
+    stories = await stories_for_viewer(viewer_id)
+    return with_etag(json_response(stories, List[StoryOut]), "stories", etag)
+
+@api_router.post("/stories/{story_id}/seen")
+async def mark_story_seen(story_id: str, viewer_id: str = Depends(get_viewer_id)):
+    story = await db.stories.find_one({"id": story_id}, {"_id": 0, "user_id": 1, "created_at": 1, "expires_at": 1})
+    if not story:
+        raise HTTPException(status_code=404, detail="Story not found")
+    view = story_view(viewer_id, story)
+    # $max keeps the marker at the newest story seen even if views arrive out of order
+    await db.story_views.update_one(
+        {"viewer_id": viewer_id, "author_id": view["author_id"]},
+        {"$max": {"seen_until": view["seen_until"], "expires_at": view["expires_at"]}},
+        upsert=True,
+    )
+    await cache.bump("story_views")
+    return {"is_seen": True}
+
+@api_router.get("/events")
+async def stream_events(posts: str = "", users: str = ""):
+    """Server-sent events for comma-separated post and user ids."""
+    topics = {f"post:{p}" for p in posts.split(",") if p} | {f"user:{u}" for u in users.split(",") if u}
+    if not topics or len(topics) > EVENTS_MAX_TOPICS:
+        raise HTTPException(status_code=400, detail=f"Subscribe to between 1 and {EVENTS_MAX_TOPICS} posts/users")
 
-@api_router.get("/stories")
-async def get_stories():
-    stories = await db.stories.find({}, {"_id": 0}).to_list(20)
-    return stories
+    async def events():
+        # Subscribe inside the generator so a client gone before the first
+        # byte never leaves a subscriber behind
+        sub = bus.subscribe(topics)
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                try:
+                    await asyncio.wait_for(sub.ready.wait(), EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                pending, dropped = sub.drain()
+                chunk = b"".join(sse_message(event) for event in pending)
+                if dropped:
+                    chunk = sse_message({"type": "overflow", "dropped": dropped}) + chunk
+                yield chunk
+        finally:
+            bus.unsubscribe(sub)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @api_router.get("/explore")
-async def get_explore():
-    explore = await db.explore.find_one({"id": "explore_data"}, {"_id": 0})
-    if explore:
-        return {"images": explore.get("images", [])}
-    return {"images": EXPLORE_IMAGES}
-
-@api_router.get("/reels")
-async def get_reels():
-    posts = await db.posts.find({}, {"_id": 0}).to_list(20)
-    reels = []
-    for p in posts:
-        reels.append({
-            "id": f"reel_{p['id']}",
-            "user_id": p["user_id"],
-            "username": p["username"],
-            "user_avatar": p["user_avatar"],
-            "video_thumbnail": p["image_url"],
-            "caption": p["caption"],
-            "likes_count": p["likes_count"],
-            "comments_count": p["comments_count"],
-            "music": "Original Audio"
-        })
-    return reels
+async def get_explore(request: Request):
+    etag, not_modified = await check_etag(request, "explore", extra=trending.tag())
+    if not_modified:
+        return not_modified
+    posts = trending.posts()
+    images = [p["image_url"] for p in posts]
+    if len(images) < EXPLORE_MIN_IMAGES:
+        async def load():
+            explore = await db.explore.find_one({"id": "explore_data"}, {"_id": 0})
+            return explore.get("images", []) if explore else EXPLORE_IMAGES
+        curated = [url for url in await cached("explore", load) if url not in images]
+        images += curated[:EXPLORE_MIN_IMAGES - len(images)]
+    return with_etag(json_response({"images": images, "posts": posts}), "explore", etag)
+
+@api_router.get("/search")
+async def search(
+    q: str = Query(..., min_length=1, max_length=100),
+    kind: str = Query("all", alias="type", pattern="^(all|users|posts)$"),
+    limit: int = Query(20, ge=1, le=50),
+    offset: int = Query(0, ge=0, le=1000),
+):
+    kinds = list(SEARCH_FIELDS) if kind == "all" else [kind]
+    hits, truncated = search_index.search(q, kinds, limit + 1, offset)
+    next_offset = offset + limit if len(hits) > limit else None
+    hits = hits[:limit]
+    docs = dict(zip(kinds, await asyncio.gather(
+        *(load_search_hits(k, [item_id for _, hit_kind, item_id in hits if hit_kind == k]) for k in kinds)
+    )))
+    results = [
+        {"type": hit_kind[:-1], "score": round(score, 4), **docs[hit_kind][item_id]}
+        for score, hit_kind, item_id in hits
+        if item_id in docs[hit_kind]
+    ]
+    return json_response({"query": q, "results": results, "next_offset": next_offset, "truncated": truncated})
+
+@api_router.get("/reels", response_model=List[Reel])
+async def get_reels(request: Request):
+    if wants_ndjson(request):
+        async def to_reels(batch):
+            return await hydrate_authors(counters.apply(batch, id_field="post_id"))
+        reels = db.posts.aggregate([{"$project": REEL_PROJECTION}], batchSize=STREAM_BATCH_SIZE)
+        return ndjson_response(reels, to_reels)
+    reels = await cached("reels", load_reels)
+    return json_response(counters.apply([dict(r) for r in reels], id_field="post_id"), List[Reel])
 
 @api_router.get("/users/{user_id}")
-async def get_user(user_id: str):
-    user = await db.users.find_one({"id": user_id}, {"_id": 0})
+async def get_user(user_id: str, limit: int = Query(GRID_PAGE_SIZE, ge=1, le=50)):
+    user, (posts, posts_cursor) = await asyncio.gather(
+        db.users.find_one({"id": user_id}, {"_id": 0}),
+        user_posts_page(user_id, None, limit),
+    )
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    posts = await db.posts.find({"user_id": user_id}, {"_id": 0}).to_list(50)
-    return {**user, "posts": posts}
+    return json_response({**user, "posts": posts, "posts_next_cursor": posts_cursor})
 
-@api_router.get("/users")
-async def get_users():
-    users = await db.users.find({}, {"_id": 0}).to_list(50)
-    return users
+@api_router.get("/users/{user_id}/posts")
+async def get_user_posts(user_id: str, cursor: Optional[str] = None, limit: int = Query(GRID_PAGE_SIZE, ge=1, le=50)):
+    posts, next_cursor = await user_posts_page(user_id, cursor, limit)
+    return json_response({"posts": posts, "next_cursor": next_cursor})
+
+@api_router.post("/users/{user_id}/follow")
+async def toggle_follow(user_id: str, viewer_id: str = Depends(get_viewer_id)):
+    if user_id == viewer_id:
+        raise HTTPException(status_code=400, detail="Cannot follow yourself")
+    followee = await db.users.find_one({"id": user_id}, {"_id": 0, "followers_count": 1})
+    if not followee:
+        raise HTTPException(status_code=404, detail="User not found")
+    edge = {"follower_id": viewer_id, "followee_id": user_id}
+    removed = await db.follows.delete_one(edge)
+    if removed.deleted_count:
+        following, delta = False, -1
+        await db.timelines.delete_many({"owner_id": viewer_id, "author_id": user_id})
+    else:
+        result = await db.follows.update_one(edge, {"$setOnInsert": {"created_at": utcnow()}}, upsert=True)
+        following, delta = True, 1 if result.upserted_id is not None else 0
+        if delta and followee["followers_count"] <= FANOUT_MAX_FOLLOWERS:
+            recent = await db.posts.find({"user_id": user_id}, {"_id": 0, "id": 1, "user_id": 1, "created_at": 1}) \
+                .sort(FEED_SORT).limit(TIMELINE_BACKFILL).to_list(TIMELINE_BACKFILL)
+            if recent:
+                await db.timelines.insert_many([timeline_entry(viewer_id, p) for p in recent], ordered=False)
+    if delta:
+        await asyncio.gather(
+            db.users.update_one({"id": user_id}, {"$inc": {"followers_count": delta}}),
+            db.users.update_one({"id": viewer_id}, {"$inc": {"following_count": delta}}),
+        )
+    await cache.invalidate(f"pull:{viewer_id}", "users")
+    await cache.bump("follows", "users")
+    return {"is_following": following, "followers_count": followee["followers_count"] + delta}
+
+@api_router.get("/users", response_model=List[User])
+async def get_users(request: Request):
+    if wants_ndjson(request):
+        return ndjson_response(db.users.find({}, {"_id": 0}, batch_size=STREAM_BATCH_SIZE))
+    return json_response(await cached("users", lambda: db.users.find({}, {"_id": 0}).to_list(50)), List[User])
 
 @api_router.get("/profile")
-async def get_current_profile():
-    user = await db.users.find_one({"id": "user_1"}, {"_id": 0})
+async def get_current_profile(
+    request: Request,
+    limit: int = Query(GRID_PAGE_SIZE, ge=1, le=50),
+    viewer_id: str = Depends(get_viewer_id),
+):
+    etag, not_modified = await check_etag(request, "profile", viewer_id)
+    if not_modified:
+        return not_modified
+    # The three reads are independent, so the profile costs one concurrent round trip
+    user, (posts, posts_cursor), (saved, saved_cursor) = await asyncio.gather(
+        db.users.find_one({"id": viewer_id}, {"_id": 0}),
+        user_posts_page(viewer_id, None, limit),
+        saved_posts_page(viewer_id, None, limit),
+    )
     if not user:
-        return SEED_USERS[0]
-    posts = await db.posts.find({"user_id": "user_1"}, {"_id": 0}).to_list(50)
-    saved = await db.posts.find({"is_saved": True}, {"_id": 0}).to_list(50)
-    return {**user, "posts": posts, "saved_posts": saved}
+        raise HTTPException(status_code=404, detail="User not found")
+    return with_etag(json_response({
+        **user,
+        "posts": posts,
+        "posts_next_cursor": posts_cursor,
+        "saved_posts": saved,
+        "saved_next_cursor": saved_cursor,
+    }), "profile", etag)
+
+@api_router.get("/profile/saved")
+async def get_saved_posts(
+    cursor: Optional[str] = None,
+    limit: int = Query(GRID_PAGE_SIZE, ge=1, le=50),
+    viewer_id: str = Depends(get_viewer_id),
+):
+    posts, next_cursor = await saved_posts_page(viewer_id, cursor, limit)
+    return json_response({"posts": posts, "next_cursor": next_cursor})
 
 @api_router.post("/seed")
-async def reseed():
-    await db.users.delete_many({})
-    await db.posts.delete_many({})
-    await db.stories.delete_many({})
-    await db.comments.delete_many({})
-    await db.explore.delete_many({})
-    for u in SEED_USERS:
-        user = User(**u)
-        await db.users.insert_one(user.model_dump())
-    for p in SEED_POSTS:
-        post = Post(**p)
-        await db.posts.insert_one(post.model_dump())
-    for s in SEED_STORIES:
-        story = Story(**s)
-        await db.stories.insert_one(story.model_dump())
-    for c in SEED_COMMENTS:
-        comment = Comment(**c)
-        await db.comments.insert_one(comment.model_dump())
-    await db.explore.insert_one({"id": "explore_data", "images": EXPLORE_IMAGES})
-    return {"message": "Data reseeded successfully"}
+async def reseed(
+    synthetic_users: int = Query(0, ge=0, le=1_000_000),
+    synthetic_posts: int = Query(0, ge=0, le=10_000_000),
+    synthetic_comments: int = Query(0, ge=0, le=10_000_000),
+):
+    if synthetic_posts and not synthetic_users:
+        raise HTTPException(status_code=400, detail="synthetic_posts requires synthetic_users")
+    # Seeded post ids are reused, so deltas buffered for the old posts would
+    # otherwise be $inc'd onto the new ones
+    await counters.discard()
+    await clear_seeded_collections()
+    datasets = [seed_dataset()]
+    if synthetic_users:
+        datasets.append(synthetic_dataset(synthetic_users, synthetic_posts, synthetic_comments))
+    counts = await load_datasets(*datasets)
+    await cache.clear()
+    await cache.bump(*VERSIONED_COLLECTIONS)
+    author_cache.clear()
+    await asyncio.gather(trending.load(), search_index.build())
+    return {"message": "Data reseeded successfully", "counts": counts}
+
+@api_router.get("/cache/stats")
+async def cache_stats():
+    return cache.stats()
+
+@api_router.get("/metrics")
+async def get_metrics():
+    stats = cache.stats()
+    for route, counts in stats["routes"].items():
+        metrics.set("cache_hits", "Response cache hits since start", {"route": route}, counts["hits"])
+        metrics.set("cache_misses", "Response cache misses since start", {"route": route}, counts["misses"])
+    metrics.set("cache_entries", "Entries in the local response cache", {}, stats["entries"])
+    metrics.set("counter_buffer_pending_posts", "Posts with unflushed counter deltas", {}, len(counters.pending))
+    metrics.set("comment_queue_depth", "Comments waiting to be written", {}, comment_ingest.queue.qsize())
+    metrics.set("events_subscribers", "Connected live event streams", {}, bus.subscribers)
+    metrics.set("trending_posts_indexed", "Posts held in the trending index", {}, len(trending.ids))
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@api_router.get("/metrics/profile")
+async def get_profile_samples(route: str, limit: int = Query(30, ge=1, le=200)):
+    return Response(profiler.report(route, limit), media_type="text/plain")
+
+@api_router.get("/health")
+async def health():
+    """Liveness: the process is up and serving; never touches MongoDB."""
+    return {"status": "ok"}
+
+@api_router.get("/ready")
+async def ready():
+    """Readiness: startup finished, not shutting down, and MongoDB answers."""
+    checks = {"started": lifecycle["ready"], "trending": trending.ready, "cache": cache.name}
+    try:
+        await asyncio.wait_for(client.admin.command("ping"), READY_PING_TIMEOUT)
+        checks["mongo"] = "ok"
+    except Exception as exc:
+        checks["mongo"] = type(exc).__name__
+    ok = checks["started"] and checks["mongo"] == "ok"
+    body = {"status": "ready" if ok else "unavailable", "startup_seconds": lifecycle["startup_seconds"], **checks}
+    return ORJSONResponse(body, status_code=200 if ok else 503)
+
+# Lifespan
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start = time.perf_counter()
+    connect()
+    await warm_up()
+    await asyncio.gather(create_indexes(), cache.start())
+    if SEED_ON_STARTUP:
+        await seed_data()
+    counters.start()
+    comment_ingest.start()
+    bus.start(EVENT_SOURCE)
+    search_index.start()
+    await trending.start()
+    lifecycle["startup_seconds"] = round(time.perf_counter() - start, 3)
+    lifecycle["ready"] = True
+    logger.info("Worker %d ready in %.3fs", os.getpid(), lifecycle["startup_seconds"])
+    try:
+        yield
+    finally:
+        # Fail readiness first so load balancers stop routing here while we drain
+        lifecycle["ready"] = False
+        await comment_ingest.close()
+        await counters.close()
+        await asyncio.gather(trending.close(), search_index.close())
+        await bus.close()
+        client.close()
+        await cache.close()
+
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
 
 app.include_router(api_router)
 
+app.add_middleware(MetricsMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -410,13 +2644,3 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
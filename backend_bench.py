@@ -0,0 +1,218 @@
+"""Local latency/throughput benchmark for every /api route.
+
+Drives the FastAPI app in-process through httpx's ASGI transport, against a
+local MongoDB (MONGO_URL) or an in-memory mongomock stand-in, seeded at a
+configurable synthetic scale.
+
+    python backend_bench.py --mongomock --users 200 --posts 2000
+    python backend_bench.py --output bench.json --baseline previous.json
+
+Exits non-zero when --baseline is given and any endpoint's p95 regressed by
+more than --max-regression.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "fairy_bench")
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+import httpx  # noqa: E402
+import server  # noqa: E402
+
+# (name, method, path); {post_id}/{user_id} are filled from the seeded data
+READ_ENDPOINTS = [
+    ("get_posts", "GET", "/api/posts"),
+    ("get_posts_deep", "GET", "/api/posts?limit=20&cursor={deep_cursor}"),
+    ("get_feed", "GET", "/api/feed"),
+    ("get_post", "GET", "/api/posts/{post_id}"),
+    ("get_comments", "GET", "/api/posts/{post_id}/comments"),
+    ("get_stories", "GET", "/api/stories"),
+    ("get_explore", "GET", "/api/explore"),
+    ("get_reels", "GET", "/api/reels"),
+    ("get_users", "GET", "/api/users"),
+    ("get_user", "GET", "/api/users/{user_id}"),
+    ("get_profile", "GET", "/api/profile"),
+]
+
+WRITE_ENDPOINTS = [
+    ("toggle_like", "POST", "/api/posts/{post_id}/like"),
+    ("toggle_save", "POST", "/api/posts/{post_id}/save"),
+    ("add_comment", "POST", "/api/posts/{post_id}/comment"),
+]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def resolve_params(client):
+    page = (await client.get("/api/posts?limit=50")).json()
+    return {
+        "post_id": page["posts"][0]["id"],
+        "user_id": page["posts"][0]["user_id"],
+        "deep_cursor": page["next_cursor"] or "",
+    }
+
+
+async def measure(client, method, path, requests, concurrency):
+    """Issue `requests` calls with `concurrency` workers; return latencies in ms."""
+    latencies = []
+    statuses = {}
+    remaining = iter(range(requests))
+    body = {"text": "bench comment"} if path.endswith("/comment") else None
+
+    async def worker():
+        for _ in remaining:
+            start = time.perf_counter()
+            response = await client.request(method, path, json=body)
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return latencies, statuses, elapsed
+
+
+async def measure_allocations(client, method, path, requests):
+    """Average allocated blocks/bytes per request, measured in a separate serial pass."""
+    body = {"text": "bench comment"} if path.endswith("/comment") else None
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for _ in range(requests):
+        await client.request(method, path, json=body)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    blocks = sum(s.count_diff for s in stats if s.count_diff > 0)
+    size = sum(s.size_diff for s in stats if s.size_diff > 0)
+    return blocks / requests, size / requests
+
+
+async def run(args):
+    if args.mongomock:
+        from mongomock_motor import AsyncMongoMockClient
+
+        server.client = AsyncMongoMockClient(tz_aware=True)
+        server.db = server.client[os.environ["DB_NAME"]]
+
+    results = {
+        "config": {
+            "backend": "mongomock" if args.mongomock else os.environ["MONGO_URL"],
+            "users": args.users,
+            "posts": args.posts,
+            "comments": args.comments,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+        },
+        "endpoints": {},
+    }
+
+    async with server.app.router.lifespan_context(server.app):
+        await server.clear_seeded_collections()
+        seed_start = time.perf_counter()
+        counts = await server.load_datasets(
+            server.seed_dataset(),
+            server.synthetic_dataset(args.users, args.posts, args.comments),
+        )
+        results["seed"] = {"counts": counts, "seconds": round(time.perf_counter() - seed_start, 3)}
+        await server.cache.clear()
+
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            params = await resolve_params(client)
+            endpoints = READ_ENDPOINTS + (WRITE_ENDPOINTS if args.writes else [])
+            for name, method, template in endpoints:
+                if args.only and name not in args.only:
+                    continue
+                path = template.format(**params)
+                await measure(client, method, path, args.warmup, 1)
+                latencies, statuses, elapsed = await measure(
+                    client, method, path, args.requests, args.concurrency
+                )
+                blocks, size = await measure_allocations(client, method, path, args.alloc_requests)
+                results["endpoints"][name] = {
+                    "method": method,
+                    "path": path,
+                    "statuses": {str(k): v for k, v in statuses.items()},
+                    "p50_ms": round(statistics.median(latencies), 3),
+                    "p95_ms": round(percentile(latencies, 95), 3),
+                    "p99_ms": round(percentile(latencies, 99), 3),
+                    "max_ms": round(max(latencies), 3),
+                    "throughput_rps": round(len(latencies) / elapsed, 1),
+                    "alloc_blocks_per_request": round(blocks, 1),
+                    "alloc_bytes_per_request": round(size, 1),
+                }
+    return results
+
+
+def print_table(results):
+    header = f"{'endpoint':<16}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}{'blocks':>10}{'KiB':>10}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results["endpoints"].items():
+        print(
+            f"{name:<16}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}"
+            f"{r['throughput_rps']:>10.0f}{r['alloc_blocks_per_request']:>10.0f}"
+            f"{r['alloc_bytes_per_request'] / 1024:>10.1f}"
+        )
+
+
+def compare(results, baseline, max_regression):
+    """Return the endpoints whose p95 grew by more than max_regression (a fraction)."""
+    regressions = []
+    for name, r in results["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name)
+        if not before or before["p95_ms"] <= 0:
+            continue
+        change = r["p95_ms"] / before["p95_ms"] - 1
+        if change > max_regression:
+            regressions.append(f"{name}: p95 {before['p95_ms']}ms -> {r['p95_ms']}ms (+{change:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongomock", action="store_true", help="use an in-memory mongomock database")
+    parser.add_argument("--users", type=int, default=100, help="synthetic users to seed")
+    parser.add_argument("--posts", type=int, default=1000, help="synthetic posts to seed")
+    parser.add_argument("--comments", type=int, default=1000, help="synthetic comments to seed")
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests per endpoint")
+    parser.add_argument("--alloc-requests", type=int, default=20, help="requests in the allocation pass")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--writes", action="store_true", help="also benchmark like/save/comment")
+    parser.add_argument("--only", nargs="*", help="endpoint names to run")
+    parser.add_argument("--output", help="write results as JSON to this path")
+    parser.add_argument("--baseline", help="JSON results from a previous run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed p95 growth, e.g. 0.2 = 20%%")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print_table(results)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+    if args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text()), args.max_regression)
+        if regressions:
+            print(f"\n❌ p95 regressions ({len(regressions)}):")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print("\n✅ No p95 regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
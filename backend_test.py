@@ -41,6 +41,8 @@ class InstagramAPITester:
                         actual_count = len(response_data)
                     elif isinstance(response_data, dict) and 'images' in response_data:
                         actual_count = len(response_data['images'])
+                    elif isinstance(response_data, dict) and 'posts' in response_data:
+                        actual_count = len(response_data['posts'])
                     else:
                         actual_count = 0
                         
@@ -74,6 +76,9 @@ class InstagramAPITester:
         # Test posts endpoint (expecting 6 posts)
         self.run_test("GET Posts", "GET", "posts", 200, expected_count=6)
         
+        # Test home feed (the current user follows every seeded author)
+        self.run_test("GET Home Feed", "GET", "feed", 200, expected_count=6)
+
         # Test stories endpoint (expecting 6 stories)
         self.run_test("GET Stories", "GET", "stories", 200, expected_count=6)
         
@@ -103,8 +108,9 @@ class InstagramAPITester:
         print("\n=== Testing Post Interactions ===")
         
         # First get a post to interact with
-        success, posts = self.run_test("GET Posts for Interaction", "GET", "posts", 200)
-        if not success or not posts:
+        success, page = self.run_test("GET Posts for Interaction", "GET", "posts", 200)
+        posts = page.get('posts') if success else None
+        if not posts:
             print("❌ Cannot test interactions - no posts available")
             return
             
@@ -130,14 +136,61 @@ class InstagramAPITester:
         print("\n=== Testing Individual Post Access ===")
         
         # Get posts first to get a valid ID
-        success, posts = self.run_test("GET Posts for Individual Test", "GET", "posts", 200)
-        if success and posts:
+        success, page = self.run_test("GET Posts for Individual Test", "GET", "posts", 200)
+        posts = page.get('posts') if success else None
+        if posts:
             post_id = posts[0]['id']
             self.run_test("GET Individual Post", "GET", f"posts/{post_id}", 200)
             
             # Test invalid post ID
             self.run_test("GET Invalid Post", "GET", "posts/invalid_id", 404)
 
+    def test_feed_pagination(self):
+        """Walk the feed with a small page size and check cursors"""
+        print("\n=== Testing Feed Pagination ===")
+
+        seen = []
+        cursor = None
+        for page_num in range(10):
+            endpoint = "posts?limit=2" + (f"&cursor={cursor}" if cursor else "")
+            success, page = self.run_test(f"GET Posts Page {page_num + 1}", "GET", endpoint, 200)
+            if not success:
+                return
+            seen.extend(p['id'] for p in page.get('posts', []))
+            cursor = page.get('next_cursor')
+            if not cursor:
+                break
+
+        if len(seen) == 6 and len(set(seen)) == 6:
+            print("✅ Pagination returned every post exactly once")
+        else:
+            print(f"❌ Pagination mismatch - got {len(seen)} posts ({len(set(seen))} unique)")
+            self.failures.append(f"Pagination: Expected 6 unique posts, got {seen}")
+
+        self.run_test("GET Posts Invalid Cursor", "GET", "posts?cursor=not-a-cursor", 400)
+
+    def test_home_screen(self):
+        """Test the composite home screen and batch endpoints"""
+        print("\n=== Testing Home Screen and Batch ===")
+
+        success, home = self.run_test("GET Home Screen", "GET", "home", 200)
+        if success:
+            if len(home.get('feed', {}).get('posts', [])) == 6 and len(home.get('stories', [])) == 6:
+                print("✅ Home screen has feed and stories")
+            else:
+                print("❌ Home screen missing feed posts or stories")
+                self.failures.append("Home: Expected 6 feed posts and 6 stories")
+
+        batch = {"requests": [{"id": "stories", "path": "/api/stories"}, {"path": "/api/posts/invalid_id"}]}
+        success, data = self.run_test("POST Batch", "POST", "batch", 200, data=batch)
+        if success:
+            statuses = [r.get('status') for r in data.get('responses', [])]
+            if statuses == [200, 404]:
+                print("✅ Batch sub-request statuses correct")
+            else:
+                print(f"❌ Batch statuses wrong - Expected [200, 404], got {statuses}")
+                self.failures.append(f"Batch: Expected statuses [200, 404], got {statuses}")
+
     def run_all_tests(self):
         """Run all test suites"""
         print("🚀 Starting Instagram API Tests")
@@ -146,6 +199,8 @@ class InstagramAPITester:
         self.test_basic_endpoints()
         self.test_post_interactions() 
         self.test_individual_post()
+        self.test_feed_pagination()
+        self.test_home_screen()
         
         # Print results
         print(f"\n📊 Test Results")
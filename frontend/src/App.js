@@ -21,12 +21,9 @@ function App() {
 
   const fetchData = useCallback(async () => {
     try {
-      const [postsRes, storiesRes] = await Promise.all([
-        axios.get(`${API}/posts`),
-        axios.get(`${API}/stories`),
-      ]);
-      setPosts(postsRes.data);
-      setStories(storiesRes.data);
+      const res = await axios.get(`${API}/home`);
+      setPosts(res.data.feed.posts);
+      setStories(res.data.stories);
     } catch (e) {
       console.error("Error fetching data:", e);
     } finally {
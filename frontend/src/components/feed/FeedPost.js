@@ -227,6 +227,20 @@ export default function FeedPost({ post, onLike, onSave }) {
         </button>
       )}
 
+      {/* Latest Comments */}
+      {post.latest_comments?.map((comment) => (
+        <div
+          key={comment.id}
+          data-testid={`comment-preview-${comment.id}`}
+          className="px-3 pb-1"
+        >
+          <span className="text-[13px] text-[#262626]">
+            <span className="font-semibold mr-1">{comment.username}</span>
+            {comment.text}
+          </span>
+        </div>
+      ))}
+
       {/* Timestamp */}
       <div className="px-3 pb-3">
         <span className="text-[10px] text-[#8E8E8E] uppercase tracking-wider">
@@ -0,0 +1,59 @@
+import os
+import sys
+from datetime import timedelta
+from pathlib import Path
+
+import httpx
+import pytest
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "fairy_test")
+sys.path.insert(0, str(Path(__file__).parent.parent / "backend"))
+
+import server  # noqa: E402
+from mongomock_motor import AsyncMongoMockClient  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """A fresh in-memory database, with a fresh counter buffer in front of it."""
+    client = AsyncMongoMockClient(tz_aware=True)
+    monkeypatch.setattr(server, "client", client)
+    monkeypatch.setattr(server, "db", client["fairy_test"])
+    monkeypatch.setattr(server, "counters", server.CounterBuffer(interval=60))
+    monkeypatch.setattr(server, "cache", server.MemoryCacheBackend(server.ResponseCache()))
+    monkeypatch.setattr(server, "author_cache", server.ResponseCache())
+    return server.db
+
+
+@pytest.fixture
+async def api(db, monkeypatch):
+    """An HTTP client on the app, started (and seeded) through its lifespan."""
+    # Each test runs its own event loop; the app's queues and locks bind to one
+    monkeypatch.setattr(server, "comment_ingest", server.CommentIngest())
+    monkeypatch.setattr(server, "trending", server.TrendingIndex())
+    monkeypatch.setattr(server, "search_index", server.SearchIndex())
+    monkeypatch.setattr(server, "bus", server.EventBus())
+    async with server.app.router.lifespan_context(server.app):
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            yield client
+
+
+def make_post(post_id: str, age: timedelta = timedelta(0), **counts) -> dict:
+    return {
+        "id": post_id,
+        "user_id": "user_1",
+        "image_url": f"https://example.com/{post_id}.jpg",
+        "caption": "",
+        "location": "",
+        "likes_count": counts.get("likes", 0),
+        "comments_count": counts.get("comments", 0),
+        "saves_count": counts.get("saves", 0),
+        "created_at": server.utcnow() - age,
+    }
@@ -0,0 +1,146 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import server
+from .conftest import make_post
+
+pytestmark = pytest.mark.anyio
+
+
+def comment(post_id: str, text: str = "nice") -> dict:
+    return server.Comment(post_id=post_id, user_id="user_2", text=text).model_dump()
+
+
+@pytest.fixture
+async def ingest(db):
+    await db.posts.insert_many([make_post("a"), make_post("b")])
+    queue = server.CommentIngest(maxsize=10, batch_size=50, timeout=1.0)
+    queue.start()
+    yield queue
+    await queue.close()
+
+
+async def test_unknown_post_is_404(ingest, db):
+    with pytest.raises(HTTPException) as exc:
+        await ingest.submit(comment("missing"))
+
+    assert exc.value.status_code == 404
+    assert await db.comments.count_documents({}) == 0
+
+
+async def test_queued_comments_are_written_as_one_batch(ingest, db, monkeypatch):
+    batches = []
+    original = type(db.comments).insert_many
+
+    async def record(self, docs, **kwargs):
+        batches.append(len(docs))
+        return await original(self, docs, **kwargs)
+
+    monkeypatch.setattr(type(db.comments), "insert_many", record)
+
+    # All three are queued before the worker next runs
+    written = await asyncio.gather(
+        ingest.submit(comment("a", "one")),
+        ingest.submit(comment("a", "two")),
+        ingest.submit(comment("b", "three")),
+    )
+
+    assert batches == [3]
+    assert [doc["text"] for doc in written] == ["one", "two", "three"]
+    assert all("_id" not in doc for doc in written)
+    assert await db.comments.count_documents({"post_id": "a"}) == 2
+    # One grouped increment per post, left to the counter buffer
+    assert server.counters.pending == {"a": {"comments_count": 2}, "b": {"comments_count": 1}}
+
+
+async def test_batch_with_missing_post_still_writes_the_rest(ingest, db):
+    results = await asyncio.gather(
+        ingest.submit(comment("a")),
+        ingest.submit(comment("missing")),
+        return_exceptions=True,
+    )
+
+    assert results[0]["post_id"] == "a"
+    assert isinstance(results[1], HTTPException) and results[1].status_code == 404
+    assert await db.comments.count_documents({}) == 1
+
+
+async def test_full_queue_is_429(db, monkeypatch):
+    await db.posts.insert_one(make_post("a"))
+    release = asyncio.Event()
+    original = server.CommentIngest._write
+
+    async def blocked(self, batch):
+        await release.wait()
+        await original(self, batch)
+
+    monkeypatch.setattr(server.CommentIngest, "_write", blocked)
+    ingest = server.CommentIngest(maxsize=1, batch_size=1, timeout=1.0)
+    ingest.start()
+    # The worker holds the first comment, the queue holds the second
+    first = asyncio.create_task(ingest.submit(comment("a")))
+    await asyncio.sleep(0)
+    second = asyncio.create_task(ingest.submit(comment("a")))
+    await asyncio.sleep(0)
+
+    with pytest.raises(HTTPException) as exc:
+        await ingest.submit(comment("a"))
+
+    assert exc.value.status_code == 429
+    release.set()
+    await asyncio.gather(first, second)
+    await ingest.close()
+    assert await db.comments.count_documents({}) == 2
+
+
+async def test_not_started_is_503(db):
+    ingest = server.CommentIngest()
+
+    with pytest.raises(HTTPException) as exc:
+        await ingest.submit(comment("a"))
+
+    assert exc.value.status_code == 503
+
+
+async def test_slow_write_returns_none_and_still_lands(db, monkeypatch):
+    await db.posts.insert_one(make_post("a"))
+    original = type(db.comments).insert_many
+
+    async def slow(self, docs, **kwargs):
+        await asyncio.sleep(0.1)
+        return await original(self, docs, **kwargs)
+
+    monkeypatch.setattr(type(db.comments), "insert_many", slow)
+    ingest = server.CommentIngest(timeout=0.01)
+    ingest.start()
+
+    assert await ingest.submit(comment("a")) is None
+
+    await ingest.close()
+    assert await db.comments.count_documents({}) == 1
+    assert server.counters.pending == {"a": {"comments_count": 1}}
+
+
+async def test_close_waits_for_the_batch_in_flight(db, monkeypatch):
+    await db.posts.insert_one(make_post("a"))
+    original = type(db.comments).insert_many
+
+    async def slow(self, docs, **kwargs):
+        await asyncio.sleep(0.05)
+        return await original(self, docs, **kwargs)
+
+    monkeypatch.setattr(type(db.comments), "insert_many", slow)
+    ingest = server.CommentIngest()
+    ingest.start()
+    pending = asyncio.create_task(ingest.submit(comment("a")))
+    await asyncio.sleep(0.01)
+
+    await ingest.close()
+
+    assert (await pending)["post_id"] == "a"
+    assert server.counters.pending == {"a": {"comments_count": 1}}
+    with pytest.raises(HTTPException) as exc:
+        await ingest.submit(comment("a"))
+    assert exc.value.status_code == 503
@@ -0,0 +1,139 @@
+import asyncio
+
+import pytest
+
+import server
+from .conftest import make_post
+
+pytestmark = pytest.mark.anyio
+
+
+async def stored(db, post_id: str, field: str) -> int:
+    return (await db.posts.find_one({"id": post_id}))[field]
+
+
+async def test_flush_applies_coalesced_deltas(db):
+    await db.posts.insert_many([make_post("a", likes=1), make_post("b")])
+    buffer = server.CounterBuffer()
+    buffer.add("a", "likes_count", 1)
+    buffer.add("a", "likes_count", 2)
+    buffer.add("b", "comments_count", 1)
+    buffer.add("b", "saves_count", 0)
+
+    await buffer.flush()
+
+    assert await stored(db, "a", "likes_count") == 4
+    assert await stored(db, "b", "comments_count") == 1
+    assert buffer.pending == {} and buffer._in_flight == {}
+
+
+async def test_failed_flush_requeues_deltas(db, monkeypatch):
+    await db.posts.insert_one(make_post("a"))
+    buffer = server.CounterBuffer()
+    buffer.add("a", "likes_count", 2)
+
+    async def fail(self, ops, **kwargs):
+        # A delta arriving while the write is out must not be lost either
+        buffer.add("a", "likes_count", 1)
+        raise RuntimeError("primary stepped down")
+
+    original = type(db.posts).bulk_write
+    monkeypatch.setattr(type(db.posts), "bulk_write", fail)
+    await buffer.flush()
+
+    assert buffer.pending == {"a": {"likes_count": 3}}
+    assert buffer._in_flight == {}
+    assert await stored(db, "a", "likes_count") == 0
+
+    monkeypatch.setattr(type(db.posts), "bulk_write", original)
+    await buffer.flush()
+
+    assert await stored(db, "a", "likes_count") == 3
+    assert buffer.pending == {}
+
+
+async def test_failed_invalidation_keeps_the_flush(db, monkeypatch):
+    await db.posts.insert_one(make_post("a"))
+    buffer = server.CounterBuffer(interval=0.01)
+
+    async def fail(*keys):
+        raise ConnectionError("cache unreachable")
+
+    monkeypatch.setattr(server.cache, "invalidate", fail)
+    buffer.start()
+    try:
+        buffer.add("a", "likes_count", 2)
+        await asyncio.sleep(0.05)
+        assert await stored(db, "a", "likes_count") == 2
+        assert buffer._in_flight == {} and buffer.delta("a", "likes_count") == 0
+        # The flusher survived and keeps writing
+        buffer.add("a", "likes_count", 1)
+        await asyncio.sleep(0.05)
+        assert await stored(db, "a", "likes_count") == 3
+    finally:
+        await buffer.close()
+
+
+async def test_apply_merges_pending_and_in_flight(db):
+    buffer = server.CounterBuffer()
+    buffer._in_flight = {"a": {"likes_count": 2}}
+    buffer.add("a", "likes_count", 1)
+    buffer.add("a", "saves_count", 1)
+    docs = [{"id": "a", "likes_count": 10}, {"id": "b", "likes_count": 5}]
+
+    buffer.apply(docs)
+
+    # Fields the document was not read with are left out
+    assert docs == [{"id": "a", "likes_count": 13}, {"id": "b", "likes_count": 5}]
+    assert buffer.delta("a", "likes_count") == 3
+
+
+async def test_max_pending_wakes_the_flusher(db):
+    await db.posts.insert_many([make_post("a"), make_post("b")])
+    buffer = server.CounterBuffer(interval=60, max_pending=2)
+    buffer.start()
+    try:
+        buffer.add("a", "likes_count", 1)
+        buffer.add("b", "likes_count", 1)
+        for _ in range(50):
+            if not buffer.pending and not buffer._in_flight:
+                break
+            await asyncio.sleep(0.01)
+        assert await stored(db, "b", "likes_count") == 1
+    finally:
+        await buffer.close()
+
+
+async def test_close_finishes_the_flush_in_progress(db, monkeypatch):
+    await db.posts.insert_one(make_post("a"))
+    buffer = server.CounterBuffer(interval=60)
+    original = type(db.posts).bulk_write
+    started = asyncio.Event()
+
+    async def slow(self, ops, **kwargs):
+        started.set()
+        await asyncio.sleep(0.05)
+        return await original(self, ops, **kwargs)
+
+    monkeypatch.setattr(type(db.posts), "bulk_write", slow)
+    buffer.start()
+    buffer.add("a", "likes_count", 2)
+    buffer._wakeup.set()
+    await started.wait()
+    buffer.add("a", "likes_count", 1)
+
+    await buffer.close()
+
+    assert await stored(db, "a", "likes_count") == 3
+    assert buffer.pending == {} and buffer._in_flight == {}
+
+
+async def test_discard_drops_buffered_deltas(db):
+    await db.posts.insert_one(make_post("a"))
+    buffer = server.CounterBuffer()
+    buffer.add("a", "likes_count", 2)
+
+    await buffer.discard()
+    await buffer.flush()
+
+    assert await stored(db, "a", "likes_count") == 0
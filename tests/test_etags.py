@@ -0,0 +1,74 @@
+import fakeredis.aioredis
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def revalidate(api, path: str, etag: str, **headers):
+    return await api.get(path, headers={"If-None-Match": etag, **headers})
+
+
+async def test_unchanged_feed_is_304(api):
+    first = await api.get("/api/posts")
+    etag = first.headers["etag"]
+
+    again = await revalidate(api, "/api/posts", etag)
+
+    assert again.status_code == 304
+    assert again.headers["etag"] == etag
+    assert again.content == b""
+
+
+async def test_like_changes_the_tag(api):
+    etag = (await api.get("/api/posts")).headers["etag"]
+
+    await api.post("/api/posts/post_1/like", headers={"X-User-Id": "user_3"})
+    fresh = await revalidate(api, "/api/posts", etag)
+
+    assert fresh.status_code == 200
+    assert fresh.headers["etag"] != etag
+
+
+async def test_tags_are_per_viewer(api):
+    etag = (await api.get("/api/feed")).headers["etag"]
+
+    other = await revalidate(api, "/api/feed", etag, **{"X-User-Id": "user_2"})
+
+    assert other.status_code == 200
+    assert other.headers["vary"] == "X-User-Id"
+
+
+async def test_counter_flush_changes_the_tag(api):
+    server.counters.add("post_1", "likes_count", 1)
+    etag = (await api.get("/api/posts")).headers["etag"]
+
+    await server.counters.flush()
+
+    assert (await revalidate(api, "/api/posts", etag)).status_code == 200
+
+
+async def test_no_tags_when_disabled(api, monkeypatch):
+    monkeypatch.setattr(server, "ETAGS_ENABLED", False)
+
+    response = await api.get("/api/posts", headers={"If-None-Match": "*"})
+
+    assert response.status_code == 200
+    assert "etag" not in response.headers
+
+
+async def test_redis_versions_survive_a_flushed_redis():
+    redis = fakeredis.aioredis.FakeRedis()
+    backend = server.RedisCacheBackend(redis, server.ResponseCache())
+    before = await backend.versions(["posts", "likes"])
+    await backend.bump("posts")
+    assert await backend.versions(["posts", "likes"]) != before
+
+    await redis.flushall()
+
+    # Counters are back at zero, but under a new epoch
+    after = await backend.versions(["posts", "likes"])
+    assert after.endswith(":0,0")
+    assert after != before
+    assert await backend.versions(["posts", "likes"]) == after
@@ -0,0 +1,96 @@
+import server
+
+
+def build(*docs) -> server.SearchIndex:
+    index = server.SearchIndex()
+    for kind, doc in docs:
+        index.add(kind, doc)
+    return index
+
+
+def user(user_id: str, username: str, display_name: str = "", followers: int = 0):
+    return "users", {"id": user_id, "username": username, "display_name": display_name, "followers_count": followers}
+
+
+def post(post_id: str, caption: str, location: str = "", likes: int = 0):
+    return "posts", {"id": post_id, "caption": caption, "location": location, "likes_count": likes}
+
+
+def ids(hits) -> list:
+    return [item_id for _, _, item_id in hits]
+
+
+def test_prefix_matches_completions():
+    index = build(post("p1", "Sunset over the bay"), post("p2", "Sunny morning"), post("p3", "Rainy day"))
+
+    hits, truncated = index.search("sun", ["posts"], 10)
+
+    assert sorted(ids(hits)) == ["p1", "p2"]
+    assert not truncated
+
+
+def test_whole_word_outranks_completion():
+    index = build(post("p1", "coffee cups"), post("p2", "cup of tea"))
+
+    hits, _ = index.search("cup", ["posts"], 10)
+
+    assert ids(hits) == ["p2", "p1"]
+
+
+def test_every_term_must_match():
+    index = build(
+        post("p1", "Beach sunset", location="Bali"),
+        post("p2", "Beach morning", location="Lisbon"),
+        post("p3", "City sunset", location="Bali"),
+    )
+
+    hits, _ = index.search("beach bali", ["posts"], 10)
+
+    assert ids(hits) == ["p1"]
+    assert index.search("beach tokyo", ["posts"], 10) == ([], False)
+
+
+def test_kinds_filter_and_field_weights():
+    index = build(user("u1", "aria.lens", "Aria"), post("p1", "aria in the studio"))
+
+    hits, _ = index.search("aria", ["users", "posts"], 10)
+    assert [(kind, item_id) for _, kind, item_id in hits] == [("users", "u1"), ("posts", "p1")]
+
+    hits, _ = index.search("aria", ["posts"], 10)
+    assert ids(hits) == ["p1"]
+
+
+def test_offset_pages_do_not_overlap():
+    index = build(*(post(f"p{i}", "travel diary", likes=i) for i in range(7)))
+
+    first, _ = index.search("travel", ["posts"], 3)
+    second, _ = index.search("travel", ["posts"], 3, offset=3)
+    rest, _ = index.search("travel", ["posts"], 3, offset=6)
+
+    # Equal text scores, so popularity orders the pages
+    assert ids(first) == ["p6", "p5", "p4"]
+    assert ids(second) == ["p3", "p2", "p1"]
+    assert ids(rest) == ["p0"]
+
+
+def test_short_prefix_keeps_most_frequent_completions():
+    docs = [post(f"rare{i}", f"ab{i:03d}") for i in range(server.SEARCH_PREFIX_EXPANSIONS + 10)]
+    docs += [post(f"common{i}", "azure") for i in range(3)]
+    index = build(*docs)
+
+    hits, truncated = index.search("a", ["posts"], 100)
+
+    # The 64 kept are "azure" plus 63 of the one-document "ab..." tokens
+    assert truncated
+    assert {"common0", "common1", "common2"} <= set(ids(hits))
+    assert len(hits) == server.SEARCH_PREFIX_EXPANSIONS + 2
+
+
+def test_new_documents_are_searchable_after_build():
+    index = build(post("p1", "mountain"))
+    index.search("moun", ["posts"], 10)
+
+    index.add(*post("p2", "mountains at dawn"))
+
+    hits, _ = index.search("moun", ["posts"], 10)
+    assert sorted(ids(hits)) == ["p1", "p2"]
@@ -0,0 +1,103 @@
+from datetime import timedelta
+
+import pytest
+from pymongo.errors import OperationFailure
+
+import server
+from .conftest import make_post
+
+pytestmark = pytest.mark.anyio
+
+
+def authored(post_id: str, user_id: str, minutes_ago: int) -> dict:
+    return {**make_post(post_id, age=timedelta(minutes=minutes_ago)), "user_id": user_id}
+
+
+@pytest.fixture
+async def graph(db):
+    """viewer follows small (fanned out) and big (pulled on read)."""
+    await db.users.insert_many([
+        {"id": "viewer", "followers_count": 0},
+        {"id": "small", "followers_count": 10},
+        {"id": "big", "followers_count": server.FANOUT_MAX_FOLLOWERS + 1},
+    ])
+    await db.follows.insert_many([
+        {"follower_id": "viewer", "followee_id": "small"},
+        {"follower_id": "viewer", "followee_id": "big"},
+    ])
+    posts = [
+        authored("s1", "small", 1),
+        authored("b1", "big", 2),
+        authored("own", "viewer", 3),
+        authored("s2", "small", 4),
+        authored("b2", "big", 5),
+        authored("s3", "small", 6),
+        authored("stranger", "other", 0),
+    ]
+    await db.posts.insert_many(posts)
+    for post in posts:
+        post.pop("_id")
+    await db.timelines.insert_many([server.timeline_entry("viewer", p) for p in posts if p["user_id"] == "small"])
+    return posts
+
+
+async def read_all(limit: int) -> list:
+    ids, cursor = [], None
+    while True:
+        page, cursor = await server.home_timeline_page("viewer", cursor, limit)
+        ids += [post["id"] for post in page]
+        if cursor is None:
+            return ids
+
+
+async def test_merges_fanned_out_and_pulled_posts(graph):
+    page, cursor = await server.home_timeline_page("viewer", None, 10)
+
+    assert [post["id"] for post in page] == ["s1", "b1", "own", "s2", "b2", "s3"]
+    assert cursor is None
+
+
+async def test_pages_cover_the_feed_once(graph):
+    for limit in (1, 2, 4):
+        assert await read_all(limit) == ["s1", "b1", "own", "s2", "b2", "s3"]
+
+
+async def test_entry_for_a_pulled_post_is_not_duplicated(graph, db):
+    own = next(p for p in graph if p["id"] == "own")
+    await db.timelines.insert_one(server.timeline_entry("viewer", own))
+
+    assert await read_all(2) == ["s1", "b1", "own", "s2", "b2", "s3"]
+
+
+async def test_string_timestamps_merge_with_dates(graph, db):
+    legacy = authored("legacy", "small", 0)
+    legacy["created_at"] = legacy["created_at"].isoformat()
+    await db.posts.insert_one(legacy)
+    await db.timelines.insert_one({**server.timeline_entry("viewer", legacy), "created_at": legacy["created_at"]})
+
+    page, _ = await server.home_timeline_page("viewer", None, 3)
+
+    assert [post["id"] for post in page] == ["legacy", "s1", "b1"]
+
+
+async def test_changed_ttl_is_applied_with_collmod(db, monkeypatch):
+    calls, commands = [], []
+    collection = type(db.timelines)
+
+    async def create_indexes(self, models):
+        calls.append(self.name)
+        if len(calls) == 1:
+            raise OperationFailure("Index already exists with different options", code=85)
+
+    async def command(self, spec):
+        commands.append(spec)
+
+    monkeypatch.setattr(collection, "create_indexes", create_indexes)
+    monkeypatch.setattr(type(db), "command", command)
+
+    await server.create_collection_indexes("timelines", server.INDEXES["timelines"])
+
+    assert calls == ["timelines", "timelines"]
+    assert commands == [{"collMod": "timelines", "index": {
+        "keyPattern": {"created_at": 1}, "expireAfterSeconds": int(server.TIMELINE_TTL.total_seconds()),
+    }}]
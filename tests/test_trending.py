@@ -0,0 +1,83 @@
+from datetime import timedelta
+
+import pytest
+
+import server
+from .conftest import make_post
+
+pytestmark = pytest.mark.anyio
+
+
+def ranked_ids(index) -> list:
+    return [post["id"] for post in index.snapshot()]
+
+
+async def test_top_k_keeps_highest_engagement(db):
+    await db.posts.insert_many([
+        make_post("quiet"),
+        make_post("liked", likes=10),
+        make_post("discussed", comments=10),
+        make_post("saved", saves=10),
+    ])
+    index = server.TrendingIndex(k=3)
+    await index.load()
+
+    # Saves weigh 5, comments 3, likes 1
+    assert ranked_ids(index) == ["saved", "discussed", "liked"]
+
+
+async def test_older_posts_decay(db):
+    await db.posts.insert_many([
+        make_post("old", age=timedelta(hours=48), likes=20),
+        make_post("new", likes=20),
+    ])
+    index = server.TrendingIndex(k=2)
+    await index.load()
+
+    assert ranked_ids(index) == ["new", "old"]
+    scores = [post["score"] for post in index.snapshot()]
+    assert scores[0] > scores[1] * 10
+
+
+async def test_record_promotes_into_top_k(db):
+    await db.posts.insert_many([make_post("a", likes=5), make_post("b", likes=3), make_post("c", likes=1)])
+    index = server.TrendingIndex(k=2)
+    await index.load()
+    assert ranked_ids(index) == ["a", "b"]
+    version = index.version
+
+    index.record("c", "saves_count", 2)
+
+    assert ranked_ids(index) == ["c", "a"]
+    assert index.version > version
+
+
+async def test_record_outside_top_k_keeps_version(db):
+    await db.posts.insert_many([make_post("a", likes=50), make_post("b", likes=30), make_post("c")])
+    index = server.TrendingIndex(k=2)
+    await index.load()
+    version = index.version
+
+    index.record("c", "likes_count", 1)
+
+    assert ranked_ids(index) == ["a", "b"]
+    assert index.version == version
+
+
+async def test_add_post_enters_ranking(db):
+    await db.posts.insert_many([make_post("a", likes=1)])
+    index = server.TrendingIndex(k=2)
+    await index.load()
+
+    index.add_post(make_post("fresh", likes=5))
+
+    assert ranked_ids(index) == ["fresh", "a"]
+
+
+async def test_load_folds_in_unflushed_counters(db):
+    await db.posts.insert_many([make_post("a", likes=5), make_post("b", likes=1)])
+    server.counters.add("b", "likes_count", 10)
+    index = server.TrendingIndex(k=2)
+    await index.load()
+
+    assert ranked_ids(index) == ["b", "a"]